@@ -47,18 +47,38 @@ if version_info < (2, 6, 0):
 import os
 import re
 import wave
+import json
+import atexit
+import struct
+import marshal
+import hashlib
 
 from glob import glob
+from array import array
+from mmap import mmap, ACCESS_READ
 from bisect import bisect
-from shutil import rmtree
-from sys import argv, stderr
-from tempfile import mkdtemp
+from shutil import copyfile, rmtree
+from sys import argv, stdin, stderr, platform, byteorder
+from time import time
+from tempfile import mkdtemp, mkstemp
+from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+from contextlib import contextmanager
 from collections import defaultdict
 from getopt import getopt, GetoptError
-from subprocess import check_call, Popen, CalledProcessError, PIPE
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from subprocess import Popen, CalledProcessError, PIPE
 
 # should be in the current directory
-from textgrid import MLF  # http://github.com/kylebgorman/textgrid.py/
+from textgrid import MLF, FORMATS  # http://github.com/kylebgorman/textgrid.py/
+from textgrid import writeGrids
+
+try:  # only needed for training, and for aligning with -F or -V
+    import mfcc
+    import viterbi
+    from hmm import read_models
+except ImportError:
+    mfcc = viterbi = read_models = None
 
 DEBUG = False  # when True, temp data not deleted...
 
@@ -80,11 +100,22 @@ F = str(.01)
 SFAC = str(5.)
 PRUNING = [str(i) for i in (250., 150., 2000.)]
 
+# parallel SoX conversions, unless -j asks for more
+SOX_JOBS = cpu_count()
+
 # hidden, but useful files
 ALIGN_MLF = '.ALIGN.mlf'
 SCORES_TXT = '.SCORES.txt'
+MANIFEST_JSON = '.MANIFEST.json'
+MANIFEST_VERSION = 1
 
-# regexp for parsing the HVite trace
+# compiled dictionary cache, stored next to the dictionary
+DICT_CACHE = '.{0}.cache'
+DICT_CACHE_VERSION = 2
+DICT_CACHE_MAGIC = 'PronDict'
+
+# regexps for parsing the HVite trace
+HVITE_FILE = re.compile('.*File: (.+)$')
 HVITE_SCORE = re.compile('.+==  \[\d+ frames\] (-\d+\.\d+)')
 # the rest of the string is: '\[Ac=-\d+\.\d+ LM=0.0\] \(Act=\d+\.\d+\)'
 
@@ -109,6 +140,29 @@ CMU_PHONES = set(['AA0', 'AA1', 'AA2', 'AE0', 'AE1', 'AE2',
 SRs = [4000, 8000, 10000, 12500, 15625, 16000, 20000, 25000, 31250, 40000,
        50000, 62500, 78125, 80000, 100000, 125000, 156250, 200000]
 
+# HCopy configuration for the features used by the models
+MFCC_CFG = """TARGETRATE = 100000.0
+TARGETKIND = MFCC_D_A_0
+WINDOWSIZE = 250000.0
+PREEMCOEF = 0.97
+USEHAMMING = T
+ENORMALIZE = T
+CEPLIFTER = 22
+NUMCHANS = 20
+NUMCEPS = 12"""
+HCOPY_CFG = """SOURCEKIND = WAVEFORM
+SOURCEFORMAT = WAVE
+""" + MFCC_CFG
+
+# maximum size of the feature cache (-c), in bytes
+FEATURE_CACHE_SIZE = 1 << 30
+
+# ru_maxrss is in bytes on OS X, but kilobytes elsewhere
+RSS_PER_KB = 1024 if platform == 'darwin' else 1
+
+# the Profiler recording this run, if --profile is given
+profiler = None
+
 USAGE = """
 align.py: Forced alignment with HTK and SoX
 Kyle Gorman <gormanky@ling.upenn.edu> and Michael Wagner <chael@mcgill.ca>
@@ -119,8 +173,19 @@ Option              Function
 
 -a                  Perform speaker adaptation,
                     w/ or w/o prior training
+-c cache_dir/       Reuse features computed in
+                    earlier runs, stored here
 -d dictionary       specify a dictionary file       [default: dictionary.txt]
+-F                  Compute features with NumPy,
+                    rather than HCopy
+-f format           TextGrid format: long, short,   [default: long]
+                    or binary
 -h                  Display this message
+-i                  Only realign pairs which have
+                    changed since the last run
+-j n                Number of parallel jobs         [default: 1]
+                    (SoX conversions use at least
+                    one job per CPU)
 -m                  List files containing
                     out-of-dictionary words
 -n n                Number of training iterations   [default: 4]
@@ -128,6 +193,12 @@ Option              Function
 -s samplerate (Hz)  Samplerate for models           [default: 8000]
                     (NB: available only with -t)
 -t training_data/   Perform model training
+-V                  Align with NumPy, rather than
+                    HCopy and HVite
+--profile report    Write the time, CPU, and memory
+                    used by each stage to report
+--serve             Align wav/lab pairs requested
+                    as JSON lines on stdin
 """
 
 
@@ -145,6 +216,316 @@ def resolve(path):
     return os.path.expandvars(os.path.expanduser(path))
 
 
+def shard(items, weights, n):
+    """
+    Splits items into at most n non-empty lists of roughly equal total
+    weight, by giving the heaviest remaining item to the lightest list.
+    Each list preserves the original order of its items.
+
+    >>> shard(['a', 'b', 'c', 'd', 'e'], [5, 1, 1, 3, 2], 2)
+    [['a', 'b'], ['c', 'd', 'e']]
+    >>> shard(['a', 'b'], [1, 1], 4)
+    [['a'], ['b']]
+    """
+    shards = [[] for _ in xrange(min(n, len(items)))]
+    totals = [0.] * len(shards)
+    for i in sorted(xrange(len(items)), key=lambda i: -weights[i]):
+        j = totals.index(min(totals))
+        shards[j].append(i)
+        totals[j] += weights[i]
+    return [[items[i] for i in sorted(indices)] for indices in shards]
+
+
+class Profiler(object):
+    """
+    Records the wall time, CPU time, and peak RSS of each stage of the
+    pipeline (see stage()) and of each subprocess run in it (see
+    run_process()), and writes them to a JSON report
+    """
+
+    def __init__(self):
+        self.start = time()
+        self.stages = []
+        self.processes = []
+        self.running = []  # names of the stages now running, innermost last
+
+    @contextmanager
+    def stage(self, name):
+        start = time()
+        (me, kids) = (getrusage(RUSAGE_SELF), getrusage(RUSAGE_CHILDREN))
+        n = len(self.processes)
+        self.running.append(name)
+        try:
+            yield
+        finally:
+            self.running.pop()
+            (me2, kids2) = (getrusage(RUSAGE_SELF),
+                            getrusage(RUSAGE_CHILDREN))
+            self.stages.append({'stage': name,
+                                'parent': self.running[-1] if
+                                          self.running else None,
+                                'start': round(start - self.start, 4),
+                                'wall': round(time() - start, 4),
+                                'cpu': round(me2.ru_utime + me2.ru_stime -
+                                             me.ru_utime - me.ru_stime, 4),
+                                'children_cpu': round(kids2.ru_utime +
+                                                      kids2.ru_stime -
+                                                      kids.ru_utime -
+                                                      kids.ru_stime, 4),
+                                'max_rss_kb': me2.ru_maxrss // RSS_PER_KB,
+                                'children_max_rss_kb': max([0] +
+                                     [process['max_rss_kb'] for process in
+                                      self.processes[n:]])})
+
+    def process(self, call_list, wall, usage, returncode):
+        self.processes.append({'command': call_list[0],
+                               'args': call_list[1:],
+                               'stage': self.running[-1] if self.running
+                                        else None,
+                               'wall': round(wall, 4),
+                               'cpu': round(usage.ru_utime +
+                                            usage.ru_stime, 4),
+                               'max_rss_kb': usage.ru_maxrss // RSS_PER_KB,
+                               'returncode': returncode})
+
+    def write(self, path):
+        usage = getrusage(RUSAGE_SELF)
+        with open(path, 'w') as sink:
+            json.dump({'wall': round(time() - self.start, 4),
+                       'cpu': round(usage.ru_utime + usage.ru_stime, 4),
+                       'max_rss_kb': usage.ru_maxrss // RSS_PER_KB,
+                       'stages': sorted(self.stages,
+                                       key=lambda stage: stage['start']),
+                       'processes': self.processes}, sink, sort_keys=True,
+                      indent=1, separators=(',', ': '))
+
+
+@contextmanager
+def stage(name):
+    """
+    Records the enclosed block as a stage of the pipeline, if profiling
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+
+def run_process(call_list, stdout=None, stderr=None):
+    """
+    Runs call_list as a subprocess and waits for it to finish, recording
+    its resource usage if profiling. stdout and stderr are as for Popen,
+    but at most one may be PIPE, in which case its output is returned
+    along with the return code. Other descriptors are closed in the child,
+    so that, when run from run_jobs' threads, it does not inherit the
+    pipes of the others, which would then never reach EOF.
+    """
+    start = time()
+    proc = Popen(call_list, stdout=stdout, stderr=stderr, close_fds=True)
+    pipe = proc.stdout or proc.stderr
+    msg = None
+    if pipe:
+        msg = pipe.read()
+        pipe.close()
+    # reap it ourselves, rather than with proc.wait(), to get its rusage
+    (_, status, usage) = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    if profiler is not None:
+        profiler.process(call_list, time() - start, usage, proc.returncode)
+    return (proc.returncode, msg)
+
+
+def check_call(call_list, stdout=None):
+    """
+    The same as subprocess.check_call, but with run_process
+    """
+    returncode = run_process(call_list, stdout)[0]
+    if returncode != 0:
+        raise CalledProcessError(returncode, call_list)
+
+
+def run_jobs(jobs, n_jobs, quiet=False):
+    """
+    Runs each (name, call_list, stdout) triple in jobs as a subprocess,
+    keeping at most n_jobs of them running at once; stdout is the path of
+    a file to store standard output in, or None to discard it. If quiet,
+    standard error is captured rather than shown. Returns (name,
+    returncode, stderr) triples for the jobs that failed, in the order
+    given; stderr is None unless quiet.
+    """
+    def run(job):
+        (name, call_list, stdout) = job
+        with open(stdout or os.devnull, 'w') as sink:
+            (returncode, msg) = run_process(call_list, sink,
+                                            PIPE if quiet else None)
+        return (name, returncode, msg)
+    pool = ThreadPool(max(1, min(n_jobs, len(jobs))))
+    try:
+        results = pool.map(run, jobs)
+    finally:
+        pool.close()
+    return [result for result in results if result[1] != 0]
+
+
+def mlf_records(path):
+    """
+    Generates a (name, lines) pair for each record in the HTK MLF at path,
+    where name is the (quoted) label file name, and lines is the body of
+    the record, up to and including the terminating "."
+    """
+    with open(path, 'r') as source:
+        source.readline()  # header
+        name = None
+        for line in source:
+            if name is None:
+                name = line.rstrip()
+                lines = []
+            else:
+                lines.append(line)
+                if line.rstrip() == '.':
+                    yield (name, lines)
+                    name = None
+
+
+def mlf_root(path):
+    """
+    Returns the base name, without extension, of a (possibly quoted) file
+    name, which is how HTK matches features to labels
+
+    >>> mlf_root('"/tmp/LAB/utt1.lab"') == mlf_root('/tmp/DAT/utt1.mfc')
+    True
+    """
+    return os.path.splitext(os.path.basename(path.strip('"')))[0]
+
+
+def merge_mlfs(paths, files, path):
+    """
+    Merges the records of the MLFs at paths into a single MLF at path,
+    in the order of files (the feature or label files they are for); files
+    with no record (e.g., those HVite could not align) are skipped
+
+    >>> import tempfile
+    >>> tmp = tempfile.mkdtemp()
+    >>> shards = [os.path.join(tmp, 'align.mlf.' + str(i)) for i in (0, 1)]
+    >>> with open(shards[0], 'w') as sink:
+    ...     sink.write('#!MLF!#\\n"LAB/c.lab"\\n0 1 sil\\n.\\n')
+    >>> with open(shards[1], 'w') as sink:
+    ...     sink.write('#!MLF!#\\n"LAB/a.lab"\\n0 1 sil\\n2 3 AA1\\n.\\n')
+    >>> merged = os.path.join(tmp, 'align.mlf')
+    >>> merge_mlfs(shards, ['DAT/a.mfc', 'DAT/b.mfc', 'DAT/c.mfc'], merged)
+    >>> print open(merged, 'r').read(),
+    #!MLF!#
+    "LAB/a.lab"
+    0 1 sil
+    2 3 AA1
+    .
+    "LAB/c.lab"
+    0 1 sil
+    .
+    >>> [name for (name, lines) in mlf_records(merged)]
+    ['"LAB/a.lab"', '"LAB/c.lab"']
+    >>> rmtree(tmp)
+    """
+    records = {}
+    for shard_path in paths:
+        for (name, lines) in mlf_records(shard_path):
+            records[mlf_root(name)] = (name, lines)
+    with open(path, 'w') as sink:
+        print >> sink, '#!MLF!#'
+        for f in files:
+            if mlf_root(f) in records:
+                (name, lines) = records[mlf_root(f)]
+                print >> sink, name
+                sink.writelines(lines)
+
+
+def hash_file(path, digest):
+    """
+    Updates the hashlib object digest with the contents of the file at
+    path, and returns it
+    """
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), ''):
+            digest.update(block)
+    return digest
+
+
+def merge_sil(pron):
+    """
+    Replaces each "sil sp" in pron with "sil", like the HDMan edit command
+    "MP sil sil sp"
+
+    >>> merge_sil(['sil', 'sp', 'AA1', 'sp'])
+    ['sil', 'AA1', 'sp']
+    """
+    merged = []
+    for phone in pron:
+        if phone == SP and merged and merged[-1] == SIL:
+            continue
+        merged.append(phone)
+    return merged
+
+
+def htk_escape(word):
+    """
+    Escapes a word for an HTK dictionary, as HDMan does: backslashes and
+    a leading quote are escaped with a backslash, and unprintable
+    characters are written as octal escapes
+
+    >>> print htk_escape("'EM"), htk_escape("O'BRIEN")
+    \\'EM O'BRIEN
+    >>> print htk_escape('A\\\\B'), htk_escape('CAF\\xc9')
+    A\\\\B CAF\\311
+    """
+    escaped = []
+    for (i, char) in enumerate(word):
+        if char == '\\' or (i == 0 and char in '\'"'):
+            escaped.append('\\' + char)
+        elif ' ' <= char <= '~':
+            escaped.append(char)
+        else:
+            escaped.append('\\{0:03o}'.format(ord(char)))
+    return ''.join(escaped)
+
+
+def task_prons(the_dict, word):
+    """
+    Returns the pronunciations of word in the_dict as they are written to
+    the task dictionary, as HDMan would with the edit commands "AS sp" and
+    "MP sil sil sp": each followed by sp, and without duplicates (as with
+    HDMan -m). So the task dictionary entries for
+
+    >>> the_dict = {'A': [['AH0'], ['EY1'], ['AH0']], 'PAUSE': [['sil']]}
+
+    are, as HDMan -m writes them with those commands:
+
+    >>> for word in sorted(the_dict):
+    ...     for pron in task_prons(the_dict, word):
+    ...         print htk_escape(word), ' '.join(pron)
+    A AH0 sp
+    A EY1 sp
+    PAUSE sil
+    """
+    prons = []
+    for pron in the_dict[word]:
+        pron = merge_sil(pron + [SP])
+        if pron not in prons:
+            prons.append(pron)
+    return prons
+
+
+def dict_cache(path):
+    """
+    Returns the path of the compiled cache for the dictionary at path
+    """
+    (head, tail) = os.path.split(os.path.realpath(path))
+    return os.path.join(head, DICT_CACHE.format(tail))
+
+
 def pronify(source):
     for (i, line) in enumerate(source, 1):
         if line.startswith(';'):
@@ -155,38 +536,273 @@ def pronify(source):
 ### CLASSES
 
 
+class PronStore(object):
+    """
+    A read-only table of pronunciations, in the format of the compiled
+    dictionary cache: the magic string and the length of the header, the
+    (marshalled) header, which holds the cache key and the phoneset, and
+    then four little-endian arrays: the offset of each word in the text of
+    the words and the index of its first pronunciation, the index of the
+    first phone of each pronunciation, and the phones themselves, as
+    (uint16) indices into the phoneset; last is the text of the words, in
+    sorted order. buf may be a string or an mmap, so that the table can be
+    shared by many processes. Words are found by binary search, and their
+    pronunciations are only decoded when they are looked up.
+
+    >>> store = PronStore(PronStore.pack('key', {'THE': [['DH', 'AH0'],
+    ...                                                  ['DH', 'IY0']],
+    ...                                          'A': [['AH0']],
+    ...                                          'ZOO': [['Z', 'UW1']]}))
+    >>> (store.key, len(store), [store._word(i) for i in xrange(3)])
+    ('key', 3, ['A', 'THE', 'ZOO'])
+    >>> store.get('THE')
+    [['DH', 'AH0'], ['DH', 'IY0']]
+    >>> [word in store for word in ('A', 'ZOO', 'AA', 'TH', 'ZOOS')]
+    [True, True, False, False, False]
+    >>> store.get('AA', [])
+    []
+    >>> PronStore('not a dictionary cache')
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a dictionary cache
+    """
+    HEAD = struct.Struct('<8sI')
+
+    def __init__(self, buf):
+        (magic, size) = PronStore.HEAD.unpack_from(buf)
+        if magic != DICT_CACHE_MAGIC:
+            raise ValueError('Not a dictionary cache')
+        start = PronStore.HEAD.size
+        (self.key, self.phones, self.n_words, n_prons, n_phones) = \
+                                    marshal.loads(buf[start:start + size])
+        start += size + -(start + size) % 4
+        self._words = start
+        self._prons = self._words + 4 * (self.n_words + 1)
+        self._phones = self._prons + 4 * (self.n_words + 1)
+        self._ids = self._phones + 4 * (n_prons + 1)
+        self._text = self._ids + 2 * n_phones
+        if len(buf) < self._text:
+            raise ValueError('Truncated dictionary cache')
+        self.buf = buf
+
+    @staticmethod
+    def pack(key, d):
+        """
+        Compiles the mapping d, from words to lists of pronunciations (each
+        a list of phones), into a string in the format read by PronStore
+        """
+        words = sorted(d)
+        phones = {}
+        (word_offsets, pron_indices, phone_indices, ids) = (array('I', [0]),
+                                                            array('I', [0]),
+                                                            array('I', [0]),
+                                                            array('H'))
+        for word in words:
+            word_offsets.append(word_offsets[-1] + len(word))
+            for pron in d[word]:
+                ids.extend(phones.setdefault(ph, len(phones)) for ph in pron)
+                phone_indices.append(len(ids))
+            pron_indices.append(len(phone_indices) - 1)
+        header = marshal.dumps((key, sorted(phones, key=phones.get),
+                                len(words), len(phone_indices) - 1,
+                                len(ids)))
+        start = PronStore.HEAD.size + len(header)
+        chunks = [PronStore.HEAD.pack(DICT_CACHE_MAGIC, len(header)), header,
+                  '\0' * (-start % 4)]
+        for table in (word_offsets, pron_indices, phone_indices, ids):
+            if byteorder == 'big':
+                table.byteswap()
+            chunks.append(table.tostring())
+        return ''.join(chunks + words)
+
+    def __len__(self):
+        return self.n_words
+
+    def _word(self, i):
+        (start, end) = struct.unpack_from('<2I', self.buf,
+                                          self._words + 4 * i)
+        return self.buf[self._text + start:self._text + end]
+
+    def _index(self, word):
+        """
+        Returns the index of word, or -1 if it is not in the table
+        """
+        (lo, hi) = (0, self.n_words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_words and self._word(lo) == word:
+            return lo
+        return -1
+
+    def __contains__(self, word):
+        return self._index(word) >= 0
+
+    def get(self, word, default=None):
+        """
+        Returns the pronunciations of word, as lists of phones, or default
+        if it is not in the table
+        """
+        i = self._index(word)
+        if i < 0:
+            return default
+        (first, last) = struct.unpack_from('<2I', self.buf,
+                                           self._prons + 4 * i)
+        bounds = struct.unpack_from('<{0}I'.format(last - first + 1),
+                                    self.buf, self._phones + 4 * first)
+        ids = struct.unpack_from('<{0}H'.format(bounds[-1] - bounds[0]),
+                                 self.buf, self._ids + 2 * bounds[0])
+        phones = self.phones
+        return [[phones[j] for j in ids[start - bounds[0]:end - bounds[0]]]
+                for (start, end) in zip(bounds, bounds[1:])]
+
+
 class PronDict(object):
     """
-    A wrapper for a normal pronunciation dictionary in the CMU style
+    A wrapper for a normal pronunciation dictionary in the CMU style. If f
+    is a path, the parsed dictionary is kept in a compiled cache file next
+    to it (see dict_cache), which is rebuilt whenever the dictionary or the
+    phoneset changes, and which is memory-mapped, so that aligners running
+    at the same time share a single copy. Nothing is read until the
+    dictionary is consulted, and each entry is only decoded when it is
+    looked up (see PronStore). Pronunciations added with __setitem__ are
+    kept separately, in memory.
+
+    >>> import tempfile
+    >>> tmp = tempfile.mkdtemp()
+    >>> path = os.path.join(tmp, 'dictionary.txt')
+    >>> with open(path, 'w') as sink:
+    ...     print >> sink, 'CAT  K AE1 T'
+    ...     print >> sink, 'CAT  K AA1 T'
+    >>> phones = set(['AA1', 'AE1', 'K', 'T'])
+    >>> the_dict = PronDict(path, phones)
+    >>> the_dict['CAT']
+    [['K', 'AE1', 'T'], ['K', 'AA1', 'T']]
+    >>> cached = lambda: PronStore(open(dict_cache(path), 'rb').read()).key
+    >>> key = cached()
+    >>> PronDict(path, phones).d.key == key  # reused
+    True
+
+    The cache is rebuilt if the phoneset changes...
+
+    >>> PronDict(path, phones | set(['DH'])).d.key[-1]
+    ['AA1', 'AE1', 'DH', 'K', 'T']
+    >>> cached() == key
+    False
+    >>> key = PronDict(path, phones).d.key
+
+    ...or the dictionary is modified, or just touched:
+
+    >>> with open(path, 'a') as sink:
+    ...     print >> sink, 'TAT  T AE1 T'
+    >>> os.utime(path, (0, 0))
+    >>> PronDict(path, phones)['TAT']
+    [['T', 'AE1', 'T']]
+    >>> key = cached()
+    >>> os.utime(path, (1, 1))
+    >>> PronDict(path, phones).d.key == key
+    False
+    >>> rmtree(tmp)
     """
     def __init__(self, f, valid_phones=None):
-        source = f if hasattr(f, 'read') else open(f, 'r')
-        self.d = defaultdict(list)
-        if valid_phones:
+        self.f = f
+        self.valid_phones = valid_phones
+        self._d = None
+        self.added = {}
+        self.ood = set()
+
+    @property
+    def d(self):
+        if self._d is None:
+            self._d = self._load()
+        return self._d
+
+    def _load(self):
+        """
+        Returns the PronStore for the dictionary, from the cache if it is
+        still valid, and otherwise by parsing the dictionary (and then
+        updating the cache)
+        """
+        if hasattr(self.f, 'read'):
+            d = self._parse(self.f)
+            self.f.close()
+            return PronStore(PronStore.pack(None, d))
+        with stage('PronDict'):
+            return self._load_cached()
+
+    def _load_cached(self):
+        cache = dict_cache(self.f)
+        key = self._key()
+        try:
+            with open(cache, 'rb') as source:
+                store = PronStore(mmap(source.fileno(), 0,
+                                       access=ACCESS_READ))
+            if store.key == key:
+                return store
+        except (EnvironmentError, ValueError, TypeError, EOFError,
+                struct.error):
+            pass  # missing, stale, or corrupt; rebuild it
+        with open(self.f, 'r') as source:
+            buf = PronStore.pack(key, self._parse(source))
+        # write to a temp file and rename, so that concurrent runs never
+        # see a partial cache; the temp file is mapped before the rename,
+        # so it is the same file whichever run's cache wins
+        try:
+            (fd, temp) = mkstemp(dir=os.path.dirname(cache))
+            with os.fdopen(fd, 'w+b') as sink:
+                sink.write(buf)
+                sink.flush()
+                store = PronStore(mmap(sink.fileno(), 0, access=ACCESS_READ))
+            os.chmod(temp, 0644)
+            os.rename(temp, cache)
+            return store
+        except EnvironmentError:
+            # e.g., read-only directory; just go without
+            return PronStore(buf)
+
+    def _key(self):
+        """
+        Computes the cache key: dictionary path, mtime, and hash, and the
+        phoneset used to validate it
+        """
+        path = os.path.realpath(self.f)
+        digest = hash_file(path, hashlib.sha1())
+        phones = sorted(self.valid_phones) if self.valid_phones else None
+        return (DICT_CACHE_VERSION, path, os.path.getmtime(path),
+                digest.hexdigest(), phones)
+
+    def _parse(self, source):
+        d = defaultdict(list)
+        if self.valid_phones:
             for (i, word, pron) in pronify(source):
                 for ph in pron:
-                    if ph not in valid_phones:
+                    if ph not in self.valid_phones:
                         error('Unknown phone in dictionary ' +
-                              '({0}), line {1}: "{2}" '.format(f, i, ph) +
+                              '({0}), line {1}: "{2}" '.format(self.f, i,
+                                                               ph) +
                               '(did you want to train a new acoustic ' +
                               'model? If so, use the -t flag).')
-                self.d[word].append(pron)
+                d[word].append(pron)
         else:
             for (i, word, pron) in pronify(source):
                 for ph in pron:
                     if INVALID_PHONE.match(ph):
                         error('Invalid phone on dictionary ' +
-                              '({0}), line {1}: "{2}" '.format(f, i, ph) +
+                              '({0}), line {1}: "{2}" '.format(self.f, i,
+                                                               ph) +
                               '(phones may not start with numbers).')
-                self.d[word].append(pron)
-        source.close()
-        self.ood = set()
+                d[word].append(pron)
+        return d
 
     def __contains__(self, key):
-        return key in self.d and self.d[key] != []
+        return key in self.added or key in self.d
 
     def __getitem__(self, key):
-        getlist = self.d[key]
+        getlist = self.d.get(key, []) + [list(pron) for pron in
+                                         self.added.get(key, ())]
         if getlist or key:
             return getlist
         else:
@@ -194,10 +810,109 @@ class PronDict(object):
             raise(KeyError(key))
 
     def __repr__(self):
-        return 'PronDict({0})'.format(self.d)
+        return 'PronDict({0!r})'.format(self.f)
 
     def __setitem__(self, key, value):
-        self.d[key].append(value)
+        self.added.setdefault(key, []).append(list(value))
+
+
+class FeatureCache(object):
+    """
+    A persistent cache of .mfc files, keyed by the content of the source
+    audio, the model samplerate, and the HCopy configuration. When the
+    cache grows beyond max_size bytes, the least recently used files are
+    evicted.
+
+    >>> import tempfile
+    >>> tmp = tempfile.mkdtemp()
+    >>> cache = FeatureCache(os.path.join(tmp, 'cache'), max_size=20)
+    >>> wav = os.path.join(tmp, 'a.wav')
+    >>> with open(wav, 'wb') as sink:
+    ...     sink.write('RIFF')
+    >>> cache.key(wav, 8000) == cache.key(wav, 16000)
+    False
+    >>> cache.key(wav, 8000) == cache.key(wav, 8000, 'mfcc.py')
+    False
+    >>> mfc = os.path.join(tmp, 'a.mfc')
+    >>> cache.get('a', mfc)
+    False
+    >>> for (t, key) in enumerate('abc', 1):
+    ...     with open(mfc, 'wb') as sink:
+    ...         sink.write(key * 10)
+    ...     cache.put(key, mfc)
+    ...     os.utime(cache._path(key), (t, t))
+    >>> sorted(os.listdir(cache.path))  # no temp files left behind
+    ['a.mfc', 'b.mfc', 'c.mfc']
+    >>> cache.get('a', mfc)  # now the most recently used
+    True
+    >>> open(mfc, 'rb').read()
+    'aaaaaaaaaa'
+    >>> cache.evict()
+    >>> sorted(os.listdir(cache.path))
+    ['a.mfc', 'c.mfc']
+    >>> rmtree(tmp)
+    """
+
+    def __init__(self, path, max_size=FEATURE_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, wav, sr, front_end='HCopy'):
+        digest = hashlib.sha1()
+        digest.update('{0}\n{1}\n'.format(sr, HCOPY_CFG))
+        if front_end != 'HCopy':  # so HCopy's keys are as they were
+            digest.update('{0}\n'.format(front_end))
+        return hash_file(wav, digest).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.path, key + '.mfc')
+
+    def get(self, key, mfc):
+        """
+        Copies the features stored under key to mfc, returning True, or
+        returns False if there are none
+        """
+        path = self._path(key)
+        try:
+            copyfile(path, mfc)
+            os.utime(path, None)  # mark as recently used
+        except (IOError, OSError):
+            return False
+        return True
+
+    def put(self, key, mfc):
+        """
+        Stores the features in mfc under key
+        """
+        (fd, temp) = mkstemp(dir=self.path)
+        os.close(fd)
+        copyfile(mfc, temp)
+        os.chmod(temp, 0644)
+        os.rename(temp, self._path(key))
+
+    def evict(self):
+        """
+        Removes the least recently used files until the cache fits in
+        max_size bytes
+        """
+        entries = []
+        for path in glob(os.path.join(self.path, '*.mfc')):
+            try:
+                stat = os.stat(path)
+            except OSError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for (_, entry_size, path) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
 
 
 class Aligner(object):
@@ -207,9 +922,18 @@ class Aligner(object):
     """
 
     def __init__(self, ts_dir, tr_dir, dictionary='dictionary.txt',
-                 sr=8000, ood_mode=False, phoneset=None):
+                 sr=8000, ood_mode=False, phoneset=None, n_jobs=1,
+                 cache_dir=None, incremental=False, numpy_mfcc=False,
+                 in_process=False, tg_format='long'):
         ## class variables
         self.sr = sr
+        self.incremental = incremental
+        self.tg_format = tg_format  # recorded in the manifest
+        self.numpy_mfcc = numpy_mfcc  # compute features with mfcc.py
+        self.in_process = in_process  # align with viterbi.py
+        self.n_jobs = n_jobs
+        self.feature_cache = FeatureCache(cache_dir) if cache_dir else None
+        self.uncached = []  # (key, mfc) pairs to add to the feature cache
         self.has_sox = self._has_sox()
         # get a temporary directory to stash everything
         arg = os.environ['TMPDIR'] if 'TMPDIR' in os.environ else None
@@ -222,11 +946,15 @@ class Aligner(object):
         self.hmm_dir = os.path.join(self.tmp_dir, 'HMM')  # HMM dir
         os.mkdir(self.hmm_dir)
         ## dictionary reps
-        self.dictionary = dictionary  # string of dict location
-        self.the_dict = PronDict(dictionary, phoneset)
-        self.the_dict[SIL] = [SIL]
+        if isinstance(dictionary, PronDict):  # already loaded
+            self.the_dict = dictionary
+            self.dictionary = dictionary.f  # string of dict location
+        else:
+            self.the_dict = PronDict(dictionary, phoneset)
+            self.dictionary = dictionary  # string of dict location
+        if [SIL] not in self.the_dict[SIL]:
+            self.the_dict[SIL] = [SIL]
         # lists
-        self.words = os.path.join(self.tmp_dir, 'words')
         self.phons = os.path.join(self.tmp_dir, 'phones')
         # HMMs
         self.proto = os.path.join(self.tmp_dir, 'proto')
@@ -234,6 +962,8 @@ class Aligner(object):
         self.taskdict = os.path.join(self.tmp_dir, 'taskdict')
         # SCP files
         self.copy_scp = os.path.join(self.tmp_dir, 'copy.scp')
+        self.copy_list = []  # (wav, mfc, duration) triples in copy_scp
+        self.test_list = []  # (wav, mfc) pairs in test_scp
         self.test_scp = os.path.join(self.tmp_dir, 'test.scp')
         self.train_scp = os.path.join(self.tmp_dir, 'train.scp')
         # CFG
@@ -251,12 +981,12 @@ class Aligner(object):
         """
         Performs subclass-specific initialization operations
         """
+        ## where trained models can be found...
+        self.cur_dir = tr_dir
         ## perform checks on data
         self._check(ts_dir)
         ## make audio copies
         self._HCopy()
-        ## where trained models can be found...
-        self.cur_dir = tr_dir
 
     def _has_sox(self):
         """
@@ -275,10 +1005,86 @@ class Aligner(object):
         """
         ## check for missing, unpaired data
         (self.wav_list, lab_list) = self._lists(ts_dir)
+        ## skip pairs which are unchanged since they were last aligned
+        if self.incremental:
+            (self.wav_list, lab_list) = self._changed(ts_dir, self.wav_list,
+                                                      lab_list)
+            if not self.wav_list:
+                return
         ## check dictionary
-        self._check_dct(lab_list)
+        with stage('task dictionary'):
+            self._check_dct(lab_list)
         ## check audio
-        self._check_aud(self.wav_list)
+        with stage('audio'):
+            self._check_aud(self.wav_list)
+
+    def _changed(self, ts_dir, wav_list, lab_list):
+        """
+        Computes fingerprints (hashes of the audio, the label, the
+        dictionary entries for its words, and the models, and the front
+        end, aligner, and TextGrid format used) for each pair, and returns
+        the (wav_list, lab_list) tuple of the pairs whose fingerprints
+        differ from those in the manifest, or which lack a TextGrid. The
+        old TextGrids of those pairs are removed, so that a pair which
+        fails to realign has no TextGrid, and so is retried by the next run
+        """
+        self.manifest = os.path.join(ts_dir, MANIFEST_JSON)
+        try:
+            with open(self.manifest, 'r') as source:
+                old = json.load(source)
+            if old.get('version') != MANIFEST_VERSION:
+                old = {}
+        except (IOError, ValueError):
+            old = {}
+        old = old.get('files', {})
+        digest = hashlib.sha1()
+        digest.update('{0}\n{1}\n'.format(self.sr, MFCC_CFG))
+        for name in (MACROS, HMMDEFS):
+            hash_file(os.path.join(self.cur_dir, name), digest)
+        model = digest.hexdigest()
+        front_end = 'mfcc.py' if self.numpy_mfcc or self.in_process else \
+                    'HCopy'
+        aligner = 'viterbi.py' if self.in_process else 'HVite'
+        self.fingerprints = {}
+        changed = set()
+        for wav in wav_list:
+            (root, _) = os.path.splitext(wav)
+            lab = root + '.lab'
+            digest = hashlib.sha1()
+            for word in open(lab, 'r').readline().rstrip().split():
+                digest.update(repr((word, self.the_dict[word])))
+            fingerprint = {'wav': hash_file(wav, hashlib.sha1()).hexdigest(),
+                           'lab': hash_file(lab, hashlib.sha1()).hexdigest(),
+                           'dict': digest.hexdigest(),
+                           'model': model,
+                           'front_end': front_end,
+                           'aligner': aligner,
+                           'format': self.tg_format}
+            name = os.path.basename(root)
+            self.fingerprints[name] = fingerprint
+            if old.get(name) != fingerprint or \
+               not os.path.exists(root + '.TextGrid'):
+                changed.add(root)
+                if os.path.exists(root + '.TextGrid'):
+                    os.remove(root + '.TextGrid')
+        return ([path for path in wav_list if
+                 os.path.splitext(path)[0] in changed],
+                [path for path in lab_list if
+                 os.path.splitext(path)[0] in changed])
+
+    def update_manifest(self):
+        """
+        Records the fingerprints of the pairs which now have TextGrids in
+        the manifest, so that they are skipped by the next incremental run
+        """
+        files = {}
+        for (name, fingerprint) in self.fingerprints.iteritems():
+            path = os.path.join(os.path.dirname(self.manifest), name)
+            if os.path.exists(path + '.TextGrid'):
+                files[name] = fingerprint
+        with open(self.manifest, 'w') as sink:
+            json.dump({'version': MANIFEST_VERSION, 'files': files}, sink,
+                      indent=1, separators=(',', ': '), sort_keys=True)
 
     def _lists(self, path):
         """
@@ -355,23 +1161,29 @@ class Aligner(object):
                     for word in sorted(ood):
                         print >> sink, word
             error('Out of dictionary word(s), see {0}.'.format(OUTOFDICT))
-        ## make word
-        print >> open(self.words, 'w'), '\n'.join(found_words)
-        ded = os.path.join(self.tmp_dir, TEMP)
-        # make ded
-        print >> open(ded, 'w'), """AS {0}\nMP {1} {1} {0}""".format(SP,
-                                                                     SIL)
-        check_call(['HDMan', '-m', '-g', ded, '-w', self.words, '-n',
-                    self.phons, self.taskdict, self.dictionary])
-        # add sil
-        print >> open(self.phons, 'a'), SIL
-        ## add sil and projected words to self.taskdict
-        print >> open(self.taskdict, 'a'), '{0} {0}'.format(SIL)
-        ## run HLEd
+        ## make the task dictionary and phone list, as HDMan would with
+        ## the edit commands "AS sp" and "MP sil sil sp"
+        phones = set()
+        with open(self.taskdict, 'w') as sink:
+            for word in sorted(found_words - set([SIL])):
+                for pron in task_prons(self.the_dict, word):
+                    phones.update(pron)
+                    print >> sink, '{0} {1}'.format(htk_escape(word),
+                                                    ' '.join(pron))
+            ## add sil
+            print >> sink, '{0} {0}'.format(SIL)
+        phones.add(SIL)
+        with open(self.phons, 'w') as sink:
+            for phone in sorted(phones):
+                print >> sink, phone
+        ## run HLEd, for the phone MLF, which viterbi.py does not need
+        if self.in_process:
+            return
         led = os.path.join(self.tmp_dir, TEMP)
         print >> open(led, 'w'), 'EX\nIS {0} {0}\nDE {1}'.format(SIL, SP)
-        check_call(['HLEd', '-l', self.lab_dir, '-d', self.taskdict,
-                            '-i', self.phon_mlf, led, self.word_mlf])
+        with stage('HLEd'):
+            check_call(['HLEd', '-l', self.lab_dir, '-d', self.taskdict,
+                                '-i', self.phon_mlf, led, self.word_mlf])
 
     def _check_aud(self, wav_list, train=False):
         """
@@ -380,106 +1192,306 @@ class Aligner(object):
         """
         copy_scp = open(self.copy_scp, 'a')
         check_scp = open(self.train_scp if train else self.test_scp, 'w')
-        i = 0
+        check_list = []  # (wav, mfc) pairs in check_scp
         if self.has_sox:
+            jobs = []  # conversions, run all at once below
             for wav in wav_list:
                 head = os.path.splitext(os.path.split(wav)[1])[0]
                 mfc = os.path.join(self.aud_dir, head + '.mfc')
+                check_list.append((wav, mfc))
+                if self._cached(wav, mfc):
+                    print >> check_scp, '"{0}"'.format(mfc)
+                    continue
                 w = wave.open(wav, 'r')
-                pids = []  # pids
                 if (w.getframerate() != self.sr) or (w.getnchannels() > 1):
                     new_wav = os.path.join(self.aud_dir, head + '.wav')
-                    pids.append(Popen(['sox', '-G', wav, '-b', '16',
+                    jobs.append((wav, ['sox', '-G', wav, '-b', '16',
                                        new_wav, 'remix', '-',
                                        'rate', str(self.sr),
-                                       'dither', '-s'], stderr=PIPE))
+                                       'dither', '-s'], None))
                     wav = new_wav
-                for pid in pids:  # do a join
-                    retcode = pid.wait()
-                    if retcode != 0:
-                        raise CalledProcessError(retcode, 'sox')
                 print >> copy_scp, '"{0}" "{1}"'.format(wav, mfc)
+                self.copy_list.append((wav, mfc, w.getnframes() /
+                                       float(w.getframerate())))
                 print >> check_scp, '"{0}"'.format(mfc)
                 w.close()
+            if jobs:
+                start = time()
+                with stage('sox'):
+                    failed = run_jobs(jobs, max(self.n_jobs, SOX_JOBS),
+                                      quiet=True)
+                if failed:
+                    error('SoX failed on {0} file(s):\n{1}'.format(
+                          len(failed), '\n'.join(
+                          '{0} (exit status {1}): {2}'.format(wav, retcode,
+                                                              msg.strip())
+                          for (wav, retcode, msg) in failed)))
+                print >> stderr, '({0} file(s) converted in {1:.2f}s)'.format(
+                                 len(jobs), time() - start),
         else:
             for wav in wav_list:
                 head = os.path.splitext(wav)[0]
                 mfc = os.path.join(self.aud_dir, head + '.mfc')
+                check_list.append((wav, mfc))
+                if self._cached(wav, mfc):
+                    print >> check_scp, '"{0}"'.format(mfc)
+                    continue
                 w = wave.open(wav, 'r')
                 if (w.getframerate() != self.sr) or (w.getnchannels() != 1):
                     error('File {0} needs resampled but Sox not found ', w)
                 print >> copy_scp, '"{0}" "{1}"'.format(wav, mfc)
+                self.copy_list.append((wav, mfc, w.getnframes() /
+                                       float(w.getframerate())))
                 print >> check_scp, '"{0}"'.format(mfc)
                 w.close()
         copy_scp.close()
         check_scp.close()
+        if train:
+            self.train_list = check_list
+        else:
+            self.test_list = check_list
+
+    def _cached(self, wav, mfc):
+        """
+        Copies the features for wav to mfc from the feature cache, if it
+        has them, and returns True; otherwise, notes that the features
+        should be cached once HCopy computes them, and returns False
+        """
+        if not self.feature_cache:
+            return False
+        key = self.feature_cache.key(wav, self.sr,
+                                     'mfcc.py' if self.numpy_mfcc or
+                                     self.in_process else 'HCopy')
+        if self.feature_cache.get(key, mfc):
+            return True
+        self.uncached.append((key, mfc))
+        return False
 
     def _HCopy(self):
         """
         Compute MFCCs
         """
+        if self.in_process:  # computed as needed, in align_in_process
+            return
         # write a CFG for extracting MFCCs
-        print >> open(self.cfg, 'w'), """SOURCEKIND = WAVEFORM
-SOURCEFORMAT = WAVE
-TARGETRATE = 100000.0
-TARGETKIND = MFCC_D_A_0
-WINDOWSIZE = 250000.0
-PREEMCOEF = 0.97
-USEHAMMING = T
-ENORMALIZE = T
-CEPLIFTER = 22
-NUMCHANS = 20
-NUMCEPS = 12"""
-        check_call(['HCopy', '-C', self.cfg, '-S', self.copy_scp])
+        print >> open(self.cfg, 'w'), HCOPY_CFG
+        if not self.copy_list:  # everything came from the feature cache
+            pass
+        elif self.numpy_mfcc:
+            with stage('MFCC'):
+                mfcc.copy([(wav, mfc) for (wav, mfc, _) in self.copy_list],
+                          self.n_jobs)
+        elif self.n_jobs > 1:
+            with stage('HCopy'):
+                self._HCopy_parallel()
+        else:
+            with stage('HCopy'):
+                check_call(['HCopy', '-C', self.cfg, '-S', self.copy_scp])
+        # store what we just built
+        if self.feature_cache:
+            for (key, mfc) in self.uncached:
+                self.feature_cache.put(key, mfc)
+            self.feature_cache.evict()
         # write a CFG for what we just built
-        print >> open(self.cfg, 'w'), """TARGETRATE = 100000.0
-TARGETKIND = MFCC_D_A_0
-WINDOWSIZE = 250000.0
-PREEMCOEF = 0.97
-USEHAMMING = T
-ENORMALIZE = T
-CEPLIFTER = 22
-NUMCHANS = 20
-NUMCEPS = 12"""
+        print >> open(self.cfg, 'w'), MFCC_CFG
+
+    def _HCopy_parallel(self):
+        """
+        Compute MFCCs by running one HCopy per shard of copy_scp, with the
+        shards balanced by audio duration
+        """
+        jobs = []
+        shards = shard(self.copy_list, [dur for (_, _, dur) in
+                                        self.copy_list], self.n_jobs)
+        for (i, copy_list) in enumerate(shards):
+            copy_scp = '{0}.{1}'.format(self.copy_scp, i)
+            with open(copy_scp, 'w') as sink:
+                for (wav, mfc, _) in copy_list:
+                    print >> sink, '"{0}" "{1}"'.format(wav, mfc)
+            jobs.append((copy_scp, ['HCopy', '-C', self.cfg,
+                                    '-S', copy_scp], None))
+        failed = run_jobs(jobs, self.n_jobs)
+        if failed:
+            error('HCopy failed on {0}.'.format(', '.join(
+                  '{0} (exit status {1})'.format(copy_scp, retcode)
+                  for (copy_scp, retcode, _) in failed)))
 
     def align(self, mlf):
         """
         Align using the models in self.cur_dir and MLF to path
         """
-        check_call(['HVite', '-a', '-m', '-y', 'lab', '-o', 'SM', '-b',
-                    SIL, '-i', mlf, '-L', self.lab_dir,
-                    '-C', self.cfg, '-S', self.test_scp,
-                    '-H', os.path.join(self.cur_dir, MACROS),
-                    '-H', os.path.join(self.cur_dir, HMMDEFS),
-                    '-I', self.word_mlf, '-t'] + PRUNING +
-                   ['-s', SFAC, self.taskdict, self.phons])
+        self._HVite(mlf, ['-s', SFAC])
 
     def align_and_score(self, mlf, score):
         """
         The same as self.align(mlf), but also with a file including scores
         """
-        i = 0
-        sink = open(score, 'w')
-        call_list = ['HVite', '-T', '1', '-a', '-m', '-y', 'lab',
-                     '-o', 'SM', '-b', SIL, '-i', mlf,
-                     '-L', self.lab_dir,
-                     '-C', self.cfg, '-S', self.test_scp,
-                     '-H', os.path.join(self.cur_dir, MACROS),
-                     '-H', os.path.join(self.cur_dir, HMMDEFS),
-                     '-I', self.word_mlf, '-t'] + PRUNING + \
-                    [self.taskdict, self.phons]
-        proc = Popen(call_list, stdout=PIPE)
-        for line in proc.stdout:
-            mch = HVITE_SCORE.match(line)  # check for score line
-            if mch:
-                print >> sink, '{0}\t{1}'.format(self.wav_list[i],
-                                                 mch.group(1))
-                i += 1
+        self._write_scores(score, self._HVite(mlf, ['-T', '1']))
+
+    def _write_scores(self, score, scores):
+        """
+        Writes the scores (a dict mapping .mfc files to scores) of the
+        testing data to score, keeping those of the pairs not realigned if
+        self.incremental
+        """
+        rows = []
+        for (wav, mfc) in self.test_list:
+            if mfc in scores:  # otherwise, HVite found no path
+                rows.append((wav, scores[mfc]))
+        if self.incremental:  # keep the rows for pairs not realigned
+            aligned = set(self.wav_list)
+            try:
+                with open(score, 'r') as source:
+                    for line in source:
+                        (wav, value) = line.rstrip('\n').rsplit('\t', 1)
+                        if wav not in aligned and os.path.exists(wav):
+                            rows.append((wav, value))
+            except IOError:
+                pass
+            rows.sort()
+        with open(score, 'w') as sink:
+            for row in rows:
+                print >> sink, '{0}\t{1}'.format(*row)
+
+    def align_in_process(self, score, prefix, tg_format='long',
+                         decoder=None):
+        """
+        Aligns with viterbi.py, rather than HVite, with decoder (by default,
+        one for the models in self.cur_dir), and computes the features with
+        mfcc.py as they are needed, rather than with HCopy. The TextGrids
+        are written straight to prefix, in tg_format, and the scores to
+        score, as with self.align_and_score(). Returns the number of
+        TextGrids written. Features found in the feature cache are read
+        from it instead, so a second run gives the same result:
+
+        >>> import tempfile
+        >>> import numpy as np
+        >>> tmp = tempfile.mkdtemp()
+        >>> (data, cache) = (os.path.join(tmp, 'data'),
+        ...                  os.path.join(tmp, 'cache'))
+        >>> os.mkdir(data)
+        >>> sink = wave.open(os.path.join(data, 'utt.wav'), 'w')
+        >>> sink.setparams((1, 2, 8000, 0, 'NONE', 'not compressed'))
+        >>> noise = np.random.RandomState(0).randn(16000) * 1000
+        >>> sink.writeframes(noise.astype('<i2').tostring())
+        >>> sink.close()
+        >>> with open(os.path.join(data, 'utt.lab'), 'w') as sink:
+        ...     print >> sink, 'HELLO'
+        >>> for i in xrange(2):
+        ...     aligner = Aligner(data, 'MOD', cache_dir=cache,
+        ...                       phoneset=CMU_PHONES, in_process=True)
+        ...     print aligner.align_in_process(os.path.join(data,
+        ...                                    SCORES_TXT), data),
+        ...     print len(os.listdir(cache))
+        ...     del aligner
+        1 1
+        1 1
+        >>> rmtree(tmp)
+        """
+        if decoder is None:
+            decoder = viterbi.Decoder(read_models(
+                      os.path.join(self.cur_dir, MACROS),
+                      os.path.join(self.cur_dir, HMMDEFS)))
+        sources = dict((mfc, wav) for (wav, mfc, _) in self.copy_list)
+        uncached = set(mfc for (_, mfc) in self.uncached)
+        jobs = []
+        mfcs = {}
+        for (wav, mfc) in self.test_list:
+            (root, _) = os.path.splitext(wav)
+            words = []
+            for word in open(root + '.lab', 'r').readline().split():
+                words.append((word.decode('UTF-8'),
+                              task_prons(self.the_dict, word)))
+            # named after the word-level label file, as HVite's are
+            name = os.path.join(self.lab_dir,
+                                os.path.basename(root) + '.lab')
+            mfcs[name] = mfc
+            if mfc in sources:  # computed from the audio...
+                jobs.append((name, sources[mfc],
+                             mfc if mfc in uncached else None, words))
+            else:  # ...or already copied from the feature cache
+                jobs.append((name, None, mfc, words))
+        scores = {}
+        n = 0
+        for (name, (grid, value)) in viterbi.align_files(decoder, jobs,
+                                                         self.n_jobs):
+            if grid is not None:  # otherwise, no path was found
+                n += writeGrids([grid], prefix, tg_format)
+                scores[mfcs[name]] = '{0:.4f}'.format(value)
+        if self.feature_cache:
+            for (key, mfc) in self.uncached:
+                self.feature_cache.put(key, mfc)
+            self.feature_cache.evict()
+        self._write_scores(score, scores)
+        return n
+
+    def _HVite(self, mlf, options):
+        """
+        Run HVite over the testing data using the models in self.cur_dir
+        and the given extra options, writing the alignments to mlf. If
+        self.n_jobs > 1, the data is split into shards (balanced by feature
+        file size) which are aligned in parallel, and the resulting MLFs
+        are merged back into the order of self.test_list. Returns a dict
+        mapping .mfc files to their scores, if HVite traces them (-T 1)
+        """
+        mfcs = [mfc for (_, mfc) in self.test_list]
+        shards = shard(mfcs, [os.path.getsize(mfc) for mfc in mfcs],
+                       self.n_jobs)
+        if len(shards) > 1:
+            word_records = dict((mlf_root(name), (name, lines)) for
+                                (name, lines) in mlf_records(self.word_mlf))
+        jobs = []
+        for (i, shard_mfcs) in enumerate(shards):
+            if len(shards) > 1:
+                test_scp = '{0}.{1}'.format(self.test_scp, i)
+                word_mlf = '{0}.{1}'.format(self.word_mlf, i)
+                shard_mlf = os.path.join(self.tmp_dir, 'align.mlf.' + str(i))
+                with open(test_scp, 'w') as scp_sink:
+                    with open(word_mlf, 'w') as mlf_sink:
+                        print >> mlf_sink, '#!MLF!#'
+                        for mfc in shard_mfcs:
+                            print >> scp_sink, '"{0}"'.format(mfc)
+                            (name, lines) = word_records[mlf_root(mfc)]
+                            print >> mlf_sink, name
+                            mlf_sink.writelines(lines)
+            else:
+                (test_scp, word_mlf, shard_mlf) = (self.test_scp,
+                                                   self.word_mlf, mlf)
+            call_list = ['HVite', '-a', '-m', '-y', 'lab', '-o', 'SM',
+                         '-b', SIL, '-i', shard_mlf, '-L', self.lab_dir,
+                         '-C', self.cfg, '-S', test_scp,
+                         '-H', os.path.join(self.cur_dir, MACROS),
+                         '-H', os.path.join(self.cur_dir, HMMDEFS),
+                         '-I', word_mlf, '-t'] + PRUNING + options + \
+                        [self.taskdict, self.phons]
+            trace = os.path.join(self.tmp_dir, 'HVite.trace.' + str(i))
+            jobs.append((shard_mlf, call_list, trace))
         # make sure no errors in decoding...
-        retcode = proc.wait()
-        if retcode != 0:
-            raise CalledProcessError(retcode, call_list)
-        sink.close()
+        with stage('HVite'):
+            failed = run_jobs(jobs, self.n_jobs)
+        if failed:
+            if len(jobs) == 1:
+                raise CalledProcessError(failed[0][1], jobs[0][1])
+            error('HVite failed on {0}.'.format(', '.join(
+                  '{0} (exit status {1})'.format(job_mlf, retcode)
+                  for (job_mlf, retcode, _) in failed)))
+        # merge the alignments back into the original order
+        if len(jobs) > 1:
+            merge_mlfs([job_mlf for (job_mlf, _, _) in jobs], mfcs, mlf)
+        # collect scores, which follow the name of the file aligned
+        scores = {}
+        for (_, _, trace) in jobs:
+            mfc = None
+            for line in open(trace, 'r'):
+                mch = HVITE_FILE.match(line)
+                if mch:
+                    mfc = mch.group(1)
+                    continue
+                mch = HVITE_SCORE.match(line)  # check for score line
+                if mch and mfc:
+                    scores[mfc] = mch.group(1)
+                    mfc = None
+        return scores
 
     def __del__(self):
         """
@@ -537,9 +1549,10 @@ class TrainAligner(Aligner):
 <ENDHMM>"""
         sink.close()
         ## make vFloors
-        check_call(['HCompV', '-f', F, '-C', self.cfg,
-                              '-S', self.train_scp,
-                              '-M', self.cur_dir, self.proto])
+        with stage('HCompV'):
+            check_call(['HCompV', '-f', F, '-C', self.cfg,
+                                  '-S', self.train_scp,
+                                  '-M', self.cur_dir, self.proto])
         ## make local macro
         # get first three lines from local proto
         sink = open(os.path.join(self.cur_dir, MACROS), 'a')
@@ -574,20 +1587,26 @@ class TrainAligner(Aligner):
         if ts_dir == tr_dir:  # if training on testing
             (self.wav_list, lab_list) = self._lists(ts_dir)
             ## check and make dictionary
-            self._check_dct(lab_list)
+            with stage('task dictionary'):
+                self._check_dct(lab_list)
             ## inspect audio
-            self._check_aud(self.wav_list)
+            with stage('audio'):
+                self._check_aud(self.wav_list)
             ## IMPORTANT
             self.train_scp = self.test_scp
+            self.train_list = self.test_list
         else:  # otherwise
             (self.wav_list, ts_lab_list) = self._lists(ts_dir)
             (tr_wav_list, tr_lab_list) = self._lists(tr_dir)
             ## check and make dictionary
-            self._check_dct(ts_lab_list + tr_lab_list)
+            with stage('task dictionary'):
+                self._check_dct(ts_lab_list + tr_lab_list)
             ## inspect test audio
-            self._check_aud(self.wav_list)
+            with stage('audio'):
+                self._check_aud(self.wav_list)
             ## inspect training audio
-            self._check_aud(tr_wav_list, True)
+            with stage('audio'):
+                self._check_aud(tr_wav_list, True)
 
     def _nxt_dir(self):
         """
@@ -604,48 +1623,73 @@ class TrainAligner(Aligner):
 
     def train(self, niter):
         """
-        Perform one or more rounds of estimation
+        Perform one or more rounds of estimation. If self.n_jobs > 1, the
+        statistics for each round are accumulated over shards of the
+        training data in parallel (HERest -p i), then combined (HERest -p
+        0) to update the models
         """
+        mfcs = [mfc for (_, mfc) in self.train_list]
+        shards = shard(mfcs, [os.path.getsize(mfc) for mfc in mfcs],
+                       self.n_jobs)
+        train_scps = []
+        if len(shards) > 1:
+            for (i, shard_mfcs) in enumerate(shards, 1):
+                train_scp = '{0}.{1}'.format(self.train_scp, i)
+                with open(train_scp, 'w') as sink:
+                    for mfc in shard_mfcs:
+                        print >> sink, '"{0}"'.format(mfc)
+                train_scps.append(train_scp)
         for _ in xrange(niter):
-            check_call(['HERest', '-C', self.cfg, '-S', self.train_scp,
-                        '-I', self.phon_mlf,
-                        '-M', self.nxt_dir,
-                        '-H', os.path.join(self.cur_dir, MACROS),
-                        '-H', os.path.join(self.cur_dir, HMMDEFS),
-                        '-t'] + PRUNING + [self.phons],
-                       stdout=PIPE)
+            with stage('HERest'):
+                self._HERest(train_scps)
             self._nxt_dir()
 
+    def _HERest(self, train_scps):
+        """
+        Perform one round of estimation, as train() describes
+        """
+        call_list = ['HERest', '-C', self.cfg, '-I', self.phon_mlf,
+                     '-M', self.nxt_dir,
+                     '-H', os.path.join(self.cur_dir, MACROS),
+                     '-H', os.path.join(self.cur_dir, HMMDEFS),
+                     '-t'] + PRUNING
+        if train_scps:
+            jobs = [(train_scp, call_list + ['-p', str(i),
+                                             '-S', train_scp,
+                                             self.phons], None)
+                    for (i, train_scp) in enumerate(train_scps, 1)]
+            failed = run_jobs(jobs, self.n_jobs)
+            if failed:
+                error('HERest failed on {0}.'.format(', '.join(
+                      '{0} (exit status {1})'.format(train_scp, retcode)
+                      for (train_scp, retcode, _) in failed)))
+            accs = [os.path.join(self.nxt_dir, 'HER{0}.acc'.format(i))
+                    for i in xrange(1, len(train_scps) + 1)]
+            check_call(call_list + ['-p', '0', self.phons] + accs,
+                       stdout=PIPE)
+            for acc in accs:
+                os.remove(acc)
+        else:
+            check_call(call_list + ['-S', self.train_scp, self.phons],
+                       stdout=PIPE)
+
     def small_pause(self):
         """
         Add in a tied-state small pause model
         """
         ## make a new hmmdf
-        source = open(os.path.join(self.cur_dir, HMMDEFS), 'r+')
-        saved = ['~h "{0}"\n'.format(SP)]  # store lines to append later
-        # pass until we find SIL
-        for line in source:
-            if line.startswith('~h "{0}"'.format(SIL)):
-                break
-        # header for silence
-        saved.append('<BEGINHMM>\n<NUMSTATES> 3\n<STATE> 2\n')
-        # pass until we get to "SIL"'s middle state
-        for line in source:
-            if line == '<STATE> 3\n':
-                break
-        # grab "SIL"'s middle state
-        for line in source:
-            if line == '<STATE> 4\n':
-                break
-            saved.append(line)
+        path = os.path.join(self.cur_dir, HMMDEFS)
+        models = read_models(path)
+        # SP's only state is a copy of SIL's middle state
+        middle = models[SIL].states[1]
+        state = models.add_state(models.means[middle],
+                                 models.variances[middle],
+                                 models.gconsts[middle])
         # add in the TRANSP matrix (from VoxForge tutorial)
-        saved.append('<TRANSP> 3\n')
-        saved.append(' 0.0 1.0 0.0\n 0.0 0.9 0.1\n 0.0 0.0 0.0\n<ENDHMM>')
-        # go to the end of the file
-        source.seek(0, os.SEEK_END)
-        # append all the lines to the end of the file
-        source.writelines(saved)
-        source.close()
+        models.add_hmm(SP, [state], [[0., 1., 0.],
+                                     [0., .9, .1],
+                                     [0., 0., 0.]])
+        models.write_hmmdefs(path)
         ## tie the states together
         hed = os.path.join(self.tmp_dir, TEMP)
         print >> open(hed, 'w'), """AT 2 4 0.2 {{{1}.transP}}
@@ -653,9 +1697,10 @@ AT 4 2 0.2 {{{1}.transP}}
 AT 1 3 0.3 {{{0}.transP}}
 TI silst {{{1}.state[3],{0}.state[2]}}
 """.format(SP, SIL)
-        check_call(['HHEd', '-H', os.path.join(self.cur_dir, MACROS),
-                            '-H', os.path.join(self.cur_dir, HMMDEFS),
-                            '-M', self.nxt_dir, hed, self.phons])
+        with stage('HHEd'):
+            check_call(['HHEd', '-H', os.path.join(self.cur_dir, MACROS),
+                                '-H', os.path.join(self.cur_dir, HMMDEFS),
+                                '-M', self.nxt_dir, hed, self.phons])
         # FIXME this seems to not be necessary, but I'm not sure why.
         """
         # run HLEd
@@ -667,28 +1712,140 @@ TI silst {{{1}.state[3],{0}.state[2]}}
         self._nxt_dir()  # increments dirs
 
 
+def serve(source, sink, dictionary, sr=8000, n_jobs=1, cache_dir=None,
+          numpy_mfcc=False, in_process=False, tg_format='long'):
+    """
+    Aligns wav/lab pairs one at a time as they are requested, keeping the
+    dictionary loaded in between. Each line read from source is a JSON
+    object with "wav" and "lab" paths (plus, optionally, an "id", which is
+    echoed back, and a "textgrid" path to also write the result to); for
+    each, a JSON object is written to sink with the "textgrid" contents
+    (in tg_format; binary TextGrids are base64-encoded) and the HVite
+    "score", or with an "error" message. If in_process, the models are
+    also kept loaded, and pairs are aligned with viterbi.py.
+    """
+    the_dict = PronDict(dictionary, CMU_PHONES)
+    the_dict.d  # load it now, rather than on the first request
+    if in_process:
+        decoder = viterbi.Decoder(read_models(os.path.join('MOD', MACROS),
+                                              os.path.join('MOD', HMMDEFS)))
+    arg = os.environ['TMPDIR'] if 'TMPDIR' in os.environ else None
+    scratch = mkdtemp(dir=arg)
+    try:
+        for (i, line) in enumerate(iter(source.readline, '')):
+            if not line.strip():
+                continue
+            response = {}
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('Request is not a JSON object')
+                response['id'] = request.get('id')
+                for key in ('wav', 'lab', 'textgrid'):
+                    path = request.get(key)
+                    if path is None and key == 'textgrid':  # optional
+                        continue
+                    if not path or not isinstance(path, basestring):
+                        raise ValueError('"{0}" must be a path'.format(key))
+                ts_dir = os.path.join(scratch, str(i))
+                os.mkdir(ts_dir)
+                head = os.path.splitext(os.path.basename(request['wav']))[0]
+                copyfile(resolve(request['wav']),
+                         os.path.join(ts_dir, head + '.wav'))
+                copyfile(resolve(request['lab']),
+                         os.path.join(ts_dir, head + '.lab'))
+                path_to_mlf = os.path.join(ts_dir, ALIGN_MLF)
+                path_to_scores = os.path.join(ts_dir, SCORES_TXT)
+                aligner = Aligner(ts_dir, 'MOD', the_dict, sr, False,
+                                  CMU_PHONES, n_jobs, cache_dir,
+                                  numpy_mfcc=numpy_mfcc,
+                                  in_process=in_process)
+                if in_process:
+                    n = aligner.align_in_process(path_to_scores, ts_dir,
+                                                 tg_format, decoder)
+                    del aligner  # cleans up its temp directory
+                else:
+                    aligner.align_and_score(path_to_mlf, path_to_scores)
+                    del aligner  # cleans up its temp directory
+                    n = MLF(path_to_mlf).write(ts_dir, tg_format)
+                if n < 1:
+                    error('No paths found.')
+                textgrid = os.path.join(ts_dir, head + '.TextGrid')
+                with open(textgrid, 'rb') as tg_source:
+                    if tg_format == 'binary':
+                        response['textgrid'] = tg_source.read().encode(
+                                                                'base64')
+                    else:
+                        response['textgrid'] = tg_source.read().decode(
+                                                                'UTF-8')
+                with open(path_to_scores, 'r') as scores:
+                    response['score'] = float(scores.read().split()[-1])
+                if request.get('textgrid'):
+                    copyfile(textgrid, resolve(request['textgrid']))
+            except SystemExit, err:  # from error()
+                response['error'] = str(err.code)
+            except Exception, err:  # one bad request mustn't end the server
+                response['error'] = '{0}: {1}'.format(
+                                    err.__class__.__name__, err)
+            finally:
+                rmtree(os.path.join(scratch, str(i)), ignore_errors=True)
+            print >> sink, json.dumps(response)
+            sink.flush()
+    finally:
+        rmtree(scratch)
+
+
 ### MAIN
 if __name__ == '__main__':
 
     ## parse arguments
     # complain if no test directory specification
     try:
-        (opts, args) = getopt(argv[1:], 'd:n:s:t:aAmh')
+        (opts, args) = getopt(argv[1:], 'c:d:f:Fij:n:s:t:VaAmh',
+                              ['profile=', 'serve'])
         # default opts values
         dictionary = 'dictionary.txt'  # -d
         sr = 8000
         tr_dir = None
         ood_mode = False
         n_per_round = 4  # -n
+        n_jobs = 1  # -j
+        cache_dir = None  # -c
+        tg_format = 'long'  # -f
+        numpy_mfcc = False  # -F
+        in_process = False  # -V
+        serve_mode = False  # --serve
+        report = None  # --profile
+        incremental = False  # -i
         speaker_dependent = False  # -T
         require_training = False  # to keep track of if -n, -s used
         # go through args
         for (opt, val) in opts:
-            if opt == '-d':  # dictionary
+            if opt == '-c':  # feature cache
+                cache_dir = resolve(val)
+            elif opt == '-d':  # dictionary
                 dictionary = val
                 if not os.access(dictionary, os.R_OK):
                     print >> stderr, USAGE
                     error('-d path {0} not found'.format(dictionary))
+            elif opt == '-f':  # TextGrid format
+                tg_format = val
+                if tg_format not in FORMATS:
+                    print >> stderr, USAGE
+                    error('-f format {0} not one of: {1}'.format(tg_format,
+                                                  ', '.join(FORMATS)))
+            elif opt == '-F':
+                numpy_mfcc = True
+            elif opt == '-i':
+                incremental = True
+            elif opt == '-j':
+                try:
+                    n_jobs = int(val)
+                    if not (0 < n_jobs):
+                        raise ValueError
+                except ValueError:
+                    print >> stderr, USAGE
+                    error('-j value must be > 0')
             elif opt == '-m':  # ood_mode
                 ood_mode = True
             elif opt == '-n':
@@ -726,9 +1883,15 @@ if __name__ == '__main__':
                 if not os.access(tr_dir, os.F_OK):
                     print >> stderr, USAGE
                     error('-t path {0} cannot be read'.format(tr_dir))
+            elif opt == '-V':
+                in_process = True
             elif opt == '-h':
                 print >> stderr, USAGE
                 exit(0)
+            elif opt == '--profile':
+                report = resolve(val)
+            elif opt == '--serve':
+                serve_mode = True
             elif opt == '-a':
                 raise NotImplementedError('Not yet implemented.')  # FIXME
             else:
@@ -736,6 +1899,31 @@ if __name__ == '__main__':
     except GetoptError, err:
         print >> stderr, USAGE
         error(str(err))
+    if incremental and tr_dir:
+        error('-i is not available in training (-t) mode.')
+    if tr_dir and read_models is None:
+        error('Training (-t) requires NumPy.')
+    if numpy_mfcc and mfcc is None:
+        error('-F requires NumPy.')
+    if in_process:
+        if tr_dir:
+            error('-V is not available in training (-t) mode.')
+        if viterbi is None:
+            error('-V requires NumPy.')
+    if report:
+        # written however we exit, so failed runs can be profiled too
+        profiler = Profiler()
+        atexit.register(profiler.write, report)
+    if serve_mode:
+        if tr_dir or require_training:
+            error('--serve is not available in training (-t) mode.')
+        # HTK writes messages to stdout, so give them stderr instead, and
+        # keep the real stdout for responses
+        sink = os.fdopen(os.dup(1), 'w')
+        os.dup2(2, 1)
+        serve(stdin, sink, dictionary, sr, n_jobs, cache_dir, numpy_mfcc,
+              in_process, tg_format)
+        exit(0)
     if len(args) == 0:
         print >> stderr, USAGE
         error('No test directory specified.')
@@ -747,7 +1935,9 @@ if __name__ == '__main__':
         try:
             print >> stderr, 'Initializing...',
             aligner = TrainAligner(ts_dir, tr_dir, dictionary, sr,
-                                                          ood_mode)
+                                   ood_mode, n_jobs=n_jobs,
+                                   cache_dir=cache_dir,
+                                   numpy_mfcc=numpy_mfcc)
             print >> stderr, 'done.'
             print >> stderr, 'Training...',
             aligner.train(n_per_round)  # start training
@@ -769,7 +1959,8 @@ if __name__ == '__main__':
                                                               SCORES_TXT))
             print >> stderr, 'done.'
             print >> stderr, 'Making TextGrids...',
-            n = MLF(path_to_mlf).write(ts_dir)
+            with stage('MLF.write'):
+                n = MLF(path_to_mlf).write(ts_dir, tg_format, n_jobs)
             if n < 1:
                 error('No paths found (is your data very noisy?).')
             print >> stderr, '{0} TextGrids generated... done.'.format(n)
@@ -782,17 +1973,33 @@ if __name__ == '__main__':
         try:
             print >> stderr, 'Initializing...',
             aligner = Aligner(ts_dir, 'MOD', dictionary, sr, ood_mode,
-                              CMU_PHONES)
-            print >> stderr, 'done.'
-            print >> stderr, 'Aligning...',
-            aligner.align_and_score(path_to_mlf, os.path.join(ts_dir,
-                                                              SCORES_TXT))
+                              CMU_PHONES, n_jobs, cache_dir, incremental,
+                              numpy_mfcc, in_process, tg_format)
             print >> stderr, 'done.'
-            print >> stderr, 'Making TextGrids...',
-            n = MLF(path_to_mlf).write(ts_dir)
+            if incremental and not aligner.wav_list:
+                print >> stderr, 'No changes since last alignment.'
+                aligner.update_manifest()
+                exit(0)
+            if in_process:
+                print >> stderr, 'Aligning and making TextGrids...',
+                with stage('viterbi'):
+                    n = aligner.align_in_process(os.path.join(ts_dir,
+                                                              SCORES_TXT),
+                                                 ts_dir, tg_format)
+                print >> stderr, 'done.'
+            else:
+                print >> stderr, 'Aligning...',
+                aligner.align_and_score(path_to_mlf,
+                                        os.path.join(ts_dir, SCORES_TXT))
+                print >> stderr, 'done.'
+                print >> stderr, 'Making TextGrids...',
+                with stage('MLF.write'):
+                    n = MLF(path_to_mlf).write(ts_dir, tg_format, n_jobs)
             if n < 1:
                 error('No paths found (do you plenty of training data?).')
             print >> stderr, '{0} TextGrids generated... done.'.format(n)
+            if incremental:
+                aligner.update_manifest()
             print >> stderr, 'Alignment complete.'
         except CalledProcessError, err:
             exit(err)
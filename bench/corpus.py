@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# corpus.py: write a synthetic corpus of wav/lab pairs for benchmarking
+#
+# Each .lab file holds a few words drawn at random from the dictionary,
+# and each .wav file holds noise, of a duration proportional to the
+# number of words. Combined with the HTK stand-ins in fakehtk/, this is
+# enough to run align.py end to end (see pipeline.py).
+#
+# USAGE: python bench/corpus.py [-n 100] [-s 8000] [-c 1] [-w 2,12]
+#                               [-d dictionary.txt] corpus/
+
+import os
+import sys
+import wave
+import random
+
+from getopt import getopt
+
+DICTIONARY = os.path.join(os.path.dirname(__file__), os.pardir,
+                          'dictionary.txt')
+
+
+def words(dictionary):
+    """
+    Return a list of the words in the dictionary file, once each
+    """
+    words = []
+    prev = None
+    for line in open(dictionary, 'r'):
+        word = line.split(None, 1)[0] if line.strip() else None
+        if word and word != prev:
+            words.append(word)
+        prev = word
+    return words
+
+
+def write_corpus(path, n, sr=8000, channels=1, n_words=(2, 12),
+                 dictionary=DICTIONARY, seed=0):
+    """
+    Write n wav/lab pairs into the directory path, which is created if
+    need be, and return the list of their names
+    """
+    rng = random.Random(seed)
+    vocabulary = words(dictionary)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    names = []
+    for i in xrange(n):
+        name = 'utt{0:06d}'.format(i)
+        k = rng.randint(*n_words)
+        with open(os.path.join(path, name + '.lab'), 'w') as sink:
+            print >> sink, ' '.join(rng.choice(vocabulary) for _ in
+                                    xrange(k))
+        # about half a second for silence, and .3 seconds per word
+        n_frames = int(sr * (.5 + .3 * k))
+        sink = wave.open(os.path.join(path, name + '.wav'), 'w')
+        sink.setnchannels(channels)
+        sink.setsampwidth(2)
+        sink.setframerate(sr)
+        sink.writeframes(os.urandom(2 * channels * n_frames))
+        sink.close()
+        names.append(name)
+    return names
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:s:c:w:d:')
+    kwargs = {}
+    n = 100
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-s':
+            kwargs['sr'] = int(val)
+        elif opt == '-c':
+            kwargs['channels'] = int(val)
+        elif opt == '-w':
+            kwargs['n_words'] = tuple(int(k) for k in val.split(','))
+        elif opt == '-d':
+            kwargs['dictionary'] = val
+    if len(args) != 1:
+        exit('USAGE: python bench/corpus.py [-n 100] [-s 8000] [-c 1] '
+             '[-w 2,12] [-d dictionary.txt] corpus/')
+    write_corpus(args[0], n, **kwargs)
+    print >> sys.stderr, 'Wrote {0} wav/lab pairs to {1}'.format(n, args[0])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# eval_corpus.py: benchmark eval.py's corpus mode against one run per pair
+#
+# Writes n synthetic pairs of TextGrids (the second a jittered copy of the
+# first), then times running eval.py once for each pair, as evaluating a
+# corpus took before corpus mode, and running it once over both
+# directories.
+#
+# USAGE: python bench/eval_corpus.py [-n 200]
+
+import os
+import sys
+import random
+
+from time import time
+from shutil import rmtree
+from tempfile import mkdtemp
+from getopt import getopt
+from subprocess import check_call
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+EVAL = os.path.join(BENCH, os.pardir, 'eval.py')
+sys.path.insert(0, BENCH)
+from textgrid_write import synthetic
+
+
+def jitter(grid, sd=.02):
+    """
+    Move each boundary between adjacent intervals of grid by a random
+    amount, keeping the intervals in order
+    """
+    for tier in grid:
+        intervals = getattr(tier, 'intervals', [])
+        for (a, b) in zip(intervals, intervals[1:]):
+            if a.maxTime == b.minTime:
+                t = round(a.maxTime + random.gauss(0., sd), 5)
+                if a.minTime < t < b.maxTime:
+                    (a.maxTime, b.minTime) = (t, t)
+
+
+def timed(call_lists):
+    start = time()
+    with open(os.devnull, 'w') as sink:
+        for call_list in call_lists:
+            check_call(call_list, stdout=sink)
+    return time() - start
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:')
+    n = 200
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+    random.seed(0)
+    tmp_dir = mkdtemp()
+    try:
+        (dir1, dir2) = (os.path.join(tmp_dir, '1'), os.path.join(tmp_dir,
+                                                                 '2'))
+        os.mkdir(dir1)
+        os.mkdir(dir2)
+        names = ['{0}.TextGrid'.format(i) for i in xrange(n)]
+        for (i, name) in enumerate(names):
+            grid = synthetic(i)
+            grid.write(os.path.join(dir1, name))
+            jitter(grid)
+            grid.write(os.path.join(dir2, name))
+        old_time = timed([[sys.executable, EVAL, '-s', str(ms),
+                           os.path.join(dir1, name),
+                           os.path.join(dir2, name)] for name in names for
+                          ms in (10, 20, 50)])
+        new_time = timed([[sys.executable, EVAL, '-s', '10,20,50', dir1,
+                           dir2]])
+        print 'Evaluated {0} pairs of TextGrids at 3 tolerances'.format(n)
+        print '\tone run per pair and tolerance: {0:.3f}s'.format(old_time)
+        print '\tone run (corpus mode): {0:.3f}s ({1:.1f}x)'.format(
+                                          new_time, old_time / new_time)
+    finally:
+        rmtree(tmp_dir)
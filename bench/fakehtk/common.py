@@ -0,0 +1,93 @@
+# common.py: helpers for the stand-ins for HTK and SoX in this directory
+#
+# These read the same arguments and files as the real tools, and write
+# files of the right shape (but with meaningless contents), so that the
+# Python side of align.py can be run and timed without HTK. They work
+# with Python 2 or 3, whichever "python" is.
+
+import os
+import re
+import struct
+
+
+def opts(argv, arity):
+    """
+    Parse HTK-style options: arity maps each flag which takes arguments
+    to how many. Returns a dict mapping each flag given to the list of
+    argument lists it was given with, and the list of positional args
+    """
+    (options, args) = ({}, [])
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg.startswith('-') and len(arg) == 2:
+            n = arity.get(arg, 0)
+            options.setdefault(arg, []).append(argv[i + 1:i + 1 + n])
+            i += 1 + n
+        else:
+            args.append(arg)
+            i += 1
+    return (options, args)
+
+
+def scp(path):
+    """
+    Generate the lists of (possibly quoted) paths on each line of an SCP
+    """
+    for line in open(path, 'r'):
+        yield [field.strip('"') for field in
+               re.findall(r'"[^"]*"|\S+', line)]
+
+
+def read_dict(path):
+    """
+    Read an HTK dictionary into a dict mapping words to lists of prons
+    """
+    d = {}
+    for line in open(path, 'r'):
+        fields = line.split()
+        if fields:
+            d.setdefault(fields[0], []).append(fields[1:])
+    return d
+
+
+def read_mlf(path):
+    """
+    Read an MLF into a dict mapping the root of each label file name to
+    the list of the fields on each of its lines
+    """
+    records = {}
+    name = None
+    for line in open(path, 'r'):
+        line = line.rstrip('\n')
+        if line.startswith('#!MLF'):
+            continue
+        if line.startswith('"'):
+            name = os.path.splitext(os.path.basename(line.strip('"')))[0]
+            records[name] = []
+        elif line == '.':
+            name = None
+        elif name is not None and line:
+            records[name].append(line.split())
+    return records
+
+
+def mfc_frames(path):
+    """
+    Return the number of frames in an HTK parameter file
+    """
+    with open(path, 'rb') as source:
+        return struct.unpack('>iihh', source.read(12))[0]
+
+
+def copy_models(options):
+    """
+    Copy the model files given with -H to the directory given with -M,
+    which is what HERest, HHEd, and the like amount to here
+    """
+    out = options['-M'][0][0]
+    for (path,) in options['-H']:
+        with open(path, 'rb') as source:
+            with open(os.path.join(out, os.path.basename(path)), 'wb') as \
+                                                                    sink:
+                sink.write(source.read())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# gaussian_kernel.py: benchmark hmm.Gaussians against a per-frame loop
+#
+# Draws n frames of features from the states of the models in MOD/, then
+# computes the log likelihood of each frame given each state, one frame
+# at a time with the textbook formula, and with Gaussians.log_likelihoods
+# at several chunk sizes; checks that the results agree, and reports the
+# time taken by each.
+#
+# USAGE: python bench/gaussian_kernel.py [-n 10000]
+
+import os
+import sys
+
+from time import time
+from getopt import getopt
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hmm import read_models
+
+CHUNK_SIZES = (64, 256, 1024, 4096)
+
+
+def naive(models, features):
+    """
+    Returns the log likelihood of each frame of features given each state
+    of models, computed one frame at a time
+    """
+    scores = np.empty((len(features), len(models.means)))
+    for (i, frame) in enumerate(features):
+        scores[i] = -.5 * (models.gconsts + ((frame - models.means) ** 2 /
+                                             models.variances).sum(axis=1))
+    return scores
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:')
+    n = 10000
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+    rng = np.random.RandomState(0)
+    models = read_models(os.path.join('MOD', 'macros'),
+                         os.path.join('MOD', 'hmmdefs'))
+    states = rng.randint(len(models.means), size=n)
+    features = (models.means[states] + rng.randn(n, models.vecsize) *
+                np.sqrt(models.variances[states])).astype(np.float32)
+    print 'Scored {0} frames against {1} states'.format(n,
+                                                       len(models.means))
+    start = time()
+    expected = naive(models, features)
+    print '\tper-frame loop: {0:.3f}s'.format(time() - start)
+    start = time()
+    gaussians = models.gaussians()
+    print '\tGaussians (setup): {0:.3f}s'.format(time() - start)
+    for chunk_size in CHUNK_SIZES:
+        start = time()
+        scores = gaussians.log_likelihoods(features, chunk_size)
+        elapsed = time() - start
+        if not np.allclose(scores, expected, rtol=1e-9, atol=1e-6):
+            exit('Log likelihoods disagree (chunk size {0})'.format(
+                                                              chunk_size))
+        print '\tGaussians (chunks of {0}): {1:.3f}s'.format(chunk_size,
+                                                            elapsed)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# mfcc_hcopy.py: compare mfcc.py's features with HCopy's
+#
+# Writes n fixed .wav files (tones in noise, with a fixed seed) at each
+# samplerate, computes their features with HCopy, run with align.py's
+# configuration, and with mfcc.py, and reports the largest difference
+# between the two in each block of coefficients (statics, deltas, and
+# accelerations), relative to the size of HCopy's (or 1, if that is
+# smaller, since HTK computes in single precision), exiting with an error
+# if any is more than -t. This
+# needs HTK's HCopy in the PATH; the stand-in in fakehtk/ runs, to check
+# the plumbing, but its features are meaningless.
+#
+# USAGE: python bench/mfcc_hcopy.py [-n 10] [-t .001]
+
+import os
+import sys
+import wave
+
+from getopt import getopt
+from shutil import rmtree
+from tempfile import mkdtemp
+from subprocess import check_call
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import mfcc
+
+from align import HCOPY_CFG
+from viterbi_hvite import which
+
+SRs = (8000, 16000)
+BLOCKS = ('statics', 'deltas', 'accelerations')
+
+
+def write_wave(path, sr, rng):
+    """
+    Writes a second or two of tones in noise, sampled at sr Hz, to path
+    """
+    t = np.arange(int(sr * rng.uniform(1., 2.))) / float(sr)
+    samples = rng.randn(len(t)) * 300.
+    for hz in rng.uniform(100., sr / 2. - 100., size=3):
+        samples += 3000. * np.sin(2. * np.pi * hz * t)
+    sink = wave.open(path, 'w')
+    sink.setparams((1, 2, sr, 0, 'NONE', 'not compressed'))
+    sink.writeframes(np.round(samples).astype('<i2').tostring())
+    sink.close()
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:t:')
+    n = 10
+    tolerance = .001
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-t':
+            tolerance = float(val)
+    command = which('HCopy')
+    if command is None:
+        exit('HCopy not found')
+    if os.path.dirname(command) == os.path.realpath(os.path.join(
+                                   os.path.dirname(__file__), 'fakehtk')):
+        print 'HCopy is the stand-in in fakehtk/: agreement is meaningless'
+    rng = np.random.RandomState(0)
+    tmp_dir = mkdtemp()
+    try:
+        pairs = []
+        for sr in SRs:
+            for i in xrange(n):
+                root = os.path.join(tmp_dir, '{0}_{1}'.format(sr, i))
+                write_wave(root + '.wav', sr, rng)
+                pairs.append((root + '.wav', root + '.mfc'))
+        cfg = os.path.join(tmp_dir, 'cfg')
+        with open(cfg, 'w') as sink:
+            print >> sink, HCOPY_CFG
+        scp = os.path.join(tmp_dir, 'copy.scp')
+        with open(scp, 'w') as sink:
+            for pair in pairs:
+                print >> sink, '"{0}" "{1}"'.format(*pair)
+        check_call(['HCopy', '-C', cfg, '-S', scp])
+        errors = np.zeros(len(BLOCKS))
+        for (wav, mfc) in pairs:
+            (theirs, _, _) = mfcc.read_htk(mfc)
+            ours = mfcc.features(wav)
+            if ours.shape != theirs.shape:
+                exit('{0}: {1} frames, but HCopy has {2}'.format(
+                     os.path.basename(wav), ours.shape, theirs.shape))
+            diff = np.abs(ours.astype(float) - theirs) / \
+                   np.maximum(np.abs(theirs), 1.)
+            width = ours.shape[1] // len(BLOCKS)
+            for (j, block) in enumerate(BLOCKS):
+                errors[j] = max(errors[j],
+                                diff[:, j * width:(j + 1) * width].max())
+    finally:
+        rmtree(tmp_dir)
+    print 'Compared {0} files at {1} Hz'.format(n, ' and '.join(str(sr) for
+                                                                sr in SRs))
+    for (block, error) in zip(BLOCKS, errors):
+        print '\tlargest relative difference in {0}: {1:.2e}'.format(block,
+                                                                   error)
+    if errors.max() > tolerance:
+        exit('Features differ by more than {0:g}'.format(tolerance))
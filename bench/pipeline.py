@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# pipeline.py: time align.py end to end, without HTK
+#
+# Writes a synthetic corpus (see corpus.py), or uses the one given, then
+# runs align.py over it r times with the HTK stand-ins in fakehtk/ first
+# on the PATH, and reports the wall time of each stage from its
+# --profile report. The stand-ins are cheap, so this mostly measures the
+# Python side of the pipeline: loading the PronDict, checking the labels
+# and building the task dictionary, checking the audio, and reading the
+# MLF and writing TextGrids. The dictionary is copied to a temporary
+# directory, so the first run builds its cache, and later runs use it.
+#
+# USAGE: python bench/pipeline.py [-n 1000] [-s 8000] [-r 2] [-j 1] [-t]
+#                                 [-F] [corpus/]
+#
+# -s is the samplerate of the synthetic audio (if not 8000, SoX is run),
+# -t trains models on the corpus, rather than using the ones in MOD/, and
+# -F computes the features with mfcc.py, rather than the HCopy stand-in.
+
+import os
+import sys
+import json
+
+from time import time
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from getopt import getopt
+from subprocess import check_call
+from collections import OrderedDict
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, BENCH)
+from corpus import write_corpus, DICTIONARY
+
+
+def run(corpus, dictionary, report, n_jobs, train, numpy_mfcc):
+    """
+    Run align.py once, and return its profile report and wall time
+    """
+    env = dict(os.environ)
+    env['PATH'] = os.pathsep.join([os.path.join(BENCH, 'fakehtk'),
+                                   env.get('PATH', '')])
+    call_list = [sys.executable, os.path.join(ROOT, 'align.py'),
+                 '-d', dictionary, '-j', str(n_jobs), '--profile', report]
+    if train:
+        call_list += ['-t', corpus]
+    if numpy_mfcc:
+        call_list.append('-F')
+    start = time()
+    with open(os.devnull, 'w') as sink:
+        check_call(call_list + [corpus], cwd=ROOT, env=env, stderr=sink)
+    wall = time() - start
+    with open(report, 'r') as source:
+        return (json.load(source), wall)
+
+
+def stage_times(report):
+    """
+    Return the total wall time of each top-level stage in the report
+    """
+    times = OrderedDict()
+    for stage in report['stages']:
+        if stage['parent'] is None:
+            times[stage['stage']] = times.get(stage['stage'], 0.) + \
+                                    stage['wall']
+    return times
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:s:r:j:tF')
+    (n, sr, repeats, n_jobs, train, numpy_mfcc) = (1000, 8000, 2, 1, False,
+                                                   False)
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-s':
+            sr = int(val)
+        elif opt == '-r':
+            repeats = int(val)
+        elif opt == '-j':
+            n_jobs = int(val)
+        elif opt == '-t':
+            train = True
+        elif opt == '-F':
+            numpy_mfcc = True
+    tmp_dir = mkdtemp()
+    try:
+        if args:
+            corpus = os.path.abspath(args[0])
+        else:
+            corpus = os.path.join(tmp_dir, 'corpus')
+            write_corpus(corpus, n, sr)
+        dictionary = os.path.join(tmp_dir, 'dictionary.txt')
+        copyfile(DICTIONARY, dictionary)
+        results = []
+        for i in xrange(repeats):
+            report = os.path.join(tmp_dir, 'report{0}.json'.format(i))
+            results.append(run(corpus, dictionary, report, n_jobs, train,
+                               numpy_mfcc))
+        stages = OrderedDict()
+        for (report, wall) in results:
+            for (name, seconds) in stage_times(report).iteritems():
+                stages.setdefault(name, []).append(seconds)
+        print 'Aligned {0} pairs with -j {1}'.format(len([f for f in
+                          os.listdir(corpus) if f.endswith('.lab')]),
+                          n_jobs)
+        print '\t{0:<20}'.format('stage') + ''.join('{0:>10}'.format(
+                          'run {0}'.format(i)) for i in
+                          xrange(1, repeats + 1))
+        for (name, seconds) in stages.iteritems():
+            print '\t{0:<20}'.format(name) + ''.join('{0:>9.3f}s'.format(
+                          s) for s in seconds)
+        print '\t{0:<20}'.format('total') + ''.join('{0:>9.3f}s'.format(
+                          wall) for (report, wall) in results)
+    finally:
+        rmtree(tmp_dir)
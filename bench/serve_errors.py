@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# serve_errors.py: check that align.py --serve survives bad requests
+#
+# Writes a one-pair synthetic corpus (see corpus.py), and a truncated copy
+# of its wav file, then starts align.py --serve with the HTK stand-ins in
+# fakehtk/ first on the PATH, and sends it three requests: one whose
+# "wav" is the .lab file, one whose "wav" is the truncated file, and then
+# the pair itself. Exits with an error unless the first two get an error
+# response and the last a TextGrid, each with its own id.
+#
+# USAGE: python bench/serve_errors.py
+
+import os
+import sys
+import json
+
+from shutil import rmtree
+from tempfile import mkdtemp
+from subprocess import Popen, PIPE
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, BENCH)
+from corpus import write_corpus
+
+
+if __name__ == '__main__':
+    tmp_dir = mkdtemp()
+    try:
+        corpus = os.path.join(tmp_dir, 'corpus')
+        (name,) = write_corpus(corpus, 1)
+        wav = os.path.join(corpus, name + '.wav')
+        lab = os.path.join(corpus, name + '.lab')
+        truncated = os.path.join(tmp_dir, 'truncated.wav')
+        with open(wav, 'rb') as source:
+            with open(truncated, 'wb') as sink:
+                sink.write(source.read(30))  # part way through the header
+        requests = [{'id': 1, 'wav': lab, 'lab': lab},
+                    {'id': 2, 'wav': truncated, 'lab': lab},
+                    {'id': 3, 'wav': wav, 'lab': lab}]
+        env = dict(os.environ)
+        env['PATH'] = os.pathsep.join([os.path.join(BENCH, 'fakehtk'),
+                                       env.get('PATH', '')])
+        with open(os.devnull, 'w') as devnull:
+            server = Popen([sys.executable, os.path.join(ROOT, 'align.py'),
+                            '--serve'], cwd=ROOT, env=env, stdin=PIPE,
+                           stdout=PIPE, stderr=devnull)
+            (out, _) = server.communicate(''.join(json.dumps(request) +
+                                                  '\n' for request in
+                                                  requests))
+        responses = [json.loads(line) for line in out.splitlines()]
+        failed = server.returncode != 0 or len(responses) != len(requests)
+        for (request, response) in zip(requests, responses):
+            if response.get('id') != request['id']:
+                failed = True
+            if request['wav'] == wav:
+                ok = 'textgrid' in response and 'error' not in response
+            else:
+                ok = 'error' in response
+            failed = failed or not ok
+            print '\t{0}\t{1}\t{2}'.format(request['id'],
+                                           os.path.basename(request['wav']),
+                                           response.get('error', 'TextGrid'))
+        if failed:
+            sys.exit('Expected two errors and then a TextGrid; got {0} '
+                     'responses, and the server exited with {1}'.format(
+                     len(responses), server.returncode))
+        print 'The server answered every request'
+    finally:
+        rmtree(tmp_dir)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# textgrid_index.py: benchmark IntervalIndex and IntervalTier.addIntervals
+#
+# Builds a phone tier of n intervals (with some gaps) by adding them one at
+# a time and in bulk, then looks up m random times with
+# IntervalTier.indexContaining and with an IntervalIndex, checks that the
+# results agree, and reports the time taken by each.
+#
+# USAGE: python bench/textgrid_index.py [-n 20000] [-m 1000000]
+
+import os
+import sys
+import random
+
+from time import time
+from getopt import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from textgrid import Interval, IntervalTier, IntervalIndex
+
+
+def synthetic(n):
+    """
+    Returns n intervals of random duration, with gaps between some, in
+    random order
+    """
+    intervals = []
+    t = 0.
+    for i in xrange(n):
+        duration = round(random.uniform(.02, .2), 5)
+        intervals.append(Interval(t, round(t + duration, 5), 'AA1'))
+        t = round(t + duration + random.choice([0., 0., 0., .1]), 5)
+    random.shuffle(intervals)
+    return intervals
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:m:')
+    n = 20000
+    m = 1000000
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-m':
+            m = int(val)
+    random.seed(0)
+    intervals = synthetic(n)
+    start = time()
+    old_tier = IntervalTier('phones')
+    for interval in intervals:
+        old_tier.addInterval(interval)
+    old_time = time() - start
+    start = time()
+    new_tier = IntervalTier('phones')
+    new_tier.addIntervals(intervals)
+    new_time = time() - start
+    if old_tier.intervals != new_tier.intervals:
+        exit('Tiers disagree')
+    print 'Built a tier of {0} intervals'.format(n)
+    print '\taddInterval: {0:.3f}s'.format(old_time)
+    print '\taddIntervals: {0:.3f}s ({1:.1f}x)'.format(new_time,
+                                                   old_time / new_time)
+    end = new_tier[-1].maxTime
+    times = [random.uniform(0., end) for i in xrange(m)]
+    start = time()
+    old = [old_tier.indexContaining(t) for t in times]
+    old_time = time() - start
+    start = time()
+    index = IntervalIndex(new_tier)
+    new = index.indicesContaining(times)
+    new_time = time() - start
+    if old != new:
+        exit('Lookups disagree')
+    print 'Looked up {0} times'.format(m)
+    print '\tIntervalTier.indexContaining: {0:.3f}s'.format(old_time)
+    print '\tIntervalIndex.indicesContaining: {0:.3f}s ({1:.1f}x)'.format(
+                                           new_time, old_time / new_time)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# textgrid_memory.py: memory used by Interval/Point storage in textgrid.py
+#
+# Compares the __slots__ Interval and Point classes against equivalent
+# classes with a per-instance __dict__ (the old layout), both per object
+# (sys.getsizeof) and in total (growth in peak RSS while building a tier).
+#
+# USAGE: python bench/textgrid_memory.py [n_intervals]
+
+import os
+import sys
+import resource
+
+from sys import argv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from textgrid import Interval, IntervalTier, Point
+
+
+class DictInterval(object):
+    """
+    An Interval as it was stored before __slots__
+    """
+
+    def __init__(self, minTime, maxTime, mark):
+        self.minTime = minTime
+        self.maxTime = maxTime
+        self.mark = mark
+
+
+class DictPoint(object):
+    """
+    A Point as it was stored before __slots__
+    """
+
+    def __init__(self, time, mark):
+        self.time = time
+        self.mark = mark
+
+
+def object_size(obj):
+    """
+    Bytes used by obj itself, plus its __dict__ if it has one (but not
+    the attribute values, which are the same in both layouts)
+    """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def peak_rss():
+    # kilobytes on Linux, bytes on Mac OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def tier_growth(cls, n):
+    """
+    Growth in peak RSS from building a phone tier of n intervals of class
+    cls, in the style of MLF.read
+    """
+    before = peak_rss()
+    tier = IntervalTier('phones')
+    marks = ['AA1', 'B', 'sil', 'T']
+    tier.intervals = [cls(i * .01, (i + 1) * .01, marks[i % 4])
+                      for i in xrange(n)]
+    return peak_rss() - before
+
+
+if __name__ == '__main__':
+    n = int(argv[1]) if len(argv) > 1 else 1000000
+    print 'Per-object size (bytes):'
+    print '\tInterval: {0} with __dict__, {1} with __slots__'.format(
+          object_size(DictInterval(0., 1., 'sil')),
+          object_size(Interval(0., 1., 'sil')))
+    print '\tPoint: {0} with __dict__, {1} with __slots__'.format(
+          object_size(DictPoint(0., 'sil')), object_size(Point(0., 'sil')))
+    # __slots__ first: the __dict__ tier may reuse some of the memory it
+    # frees, which can only understate the difference
+    slots = tier_growth(Interval, n)
+    dicts = tier_growth(DictInterval, n)
+    print 'Peak RSS growth for a {0}-interval tier:'.format(n)
+    print '\t{0} with __dict__, {1} with __slots__'.format(dicts, slots)
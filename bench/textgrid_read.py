@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# textgrid_read.py: benchmark TextGrid.read against the old line reader
+#
+# Writes n synthetic TextGrids (or uses the TextGrid files given), reads
+# each with both readers, checks that the results agree, and reports the
+# time taken by each.
+#
+# USAGE: python bench/textgrid_read.py [-n 1000] [file.TextGrid ...]
+
+import os
+import re
+import sys
+
+from time import time
+from shutil import rmtree
+from tempfile import mkdtemp
+from getopt import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from textgrid import readFile, Interval, IntervalTier, Point, PointTier, \
+                     TextGrid
+
+
+def _getMark(text):
+    m = None
+    my_line = ''
+    while True:
+        my_line += text.readline()
+        m = re.search(r'(\S+)\s(=)\s(".*")', my_line, re.DOTALL)
+        if m != None:
+            break
+    return m.groups()[2][1:-1]
+
+
+def old_read(self, f):
+    """
+    TextGrid.read as it was before the single-pass tokenizer
+    """
+    source = readFile(f)
+    source.readline() # header junk
+    source.readline() # header junk
+    source.readline() # header junk
+    self.minTime = round(float(source.readline().split()[2]), 5)
+    self.maxTime = round(float(source.readline().split()[2]), 5)
+    source.readline() # more header junk
+    m = int(source.readline().rstrip().split()[2]) # will be self.n
+    source.readline()
+    for i in xrange(m): # loop over grids
+        source.readline()
+        if source.readline().rstrip().split()[2] == '"IntervalTier"': 
+            inam = source.readline().rstrip().split(' = ')[1].strip('"')
+            imin = round(float(source.readline().rstrip().split()[2]), 5)
+            imax = round(float(source.readline().rstrip().split()[2]), 5)
+            itie = IntervalTier(inam)
+            for j in xrange(int(source.readline().rstrip().split()[3])):
+                source.readline().rstrip().split() # header junk
+                jmin = round(float(source.readline().rstrip().split()[2]), 5)
+                jmax = round(float(source.readline().rstrip().split()[2]), 5)
+                jmrk = _getMark(source)
+                if jmin < jmax: # non-null
+                    itie.addInterval(Interval(jmin, jmax, jmrk))
+            self.append(itie)
+        else: # pointTier
+            inam = source.readline().rstrip().split(' = ')[1].strip('"')
+            imin = round(float(source.readline().rstrip().split()[2]), 5)
+            imax = round(float(source.readline().rstrip().split()[2]), 5)
+            itie = PointTier(inam)
+            n = int(source.readline().rstrip().split()[3])
+            for j in xrange(n):
+                source.readline().rstrip() # header junk
+                jtim = round(float(source.readline().rstrip().split()[2]), 5)
+                jmrk = source.readline().rstrip().split()[2][1:-1]
+                itie.addPoint(Point(jtim, jmrk))
+            self.append(itie)
+    source.close()
+
+
+def synthetic(path, i, n_words=30):
+    """
+    Writes a TextGrid like those align.py makes, with n_words words of
+    four phones each, and some multi-line text fields
+    """
+    grid = TextGrid(str(i))
+    phones = IntervalTier('phones')
+    words = IntervalTier('words')
+    t = 0.
+    for w in xrange(n_words):
+        words.add(t, round(t + .4, 5), 'WORD{0}'.format(w) if w % 10 else
+                                       'TWO\nLINES')
+        for p in xrange(4):
+            phones.add(t, round(t + .1, 5), 'AA1')
+            t = round(t + .1, 5)
+    grid.extend([phones, words])
+    grid.write(path)
+
+
+def describe(grid):
+    return [(tier.name, [repr(x) for x in tier]) for tier in grid]
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:')
+    n = 1000
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+    tmp_dir = None
+    if not args:
+        tmp_dir = mkdtemp()
+        for i in xrange(n):
+            args.append(os.path.join(tmp_dir, '{0}.TextGrid'.format(i)))
+            synthetic(args[-1], i)
+    try:
+        start = time()
+        old = []
+        for path in args:
+            grid = TextGrid()
+            old_read(grid, path)
+            old.append(grid)
+        old_time = time() - start
+        start = time()
+        new = []
+        for path in args:
+            grid = TextGrid()
+            grid.read(path)
+            new.append(grid)
+        new_time = time() - start
+        for (path, old_grid, new_grid) in zip(args, old, new):
+            if describe(old_grid) != describe(new_grid):
+                exit('Readers disagree on {0}'.format(path))
+        print 'Read {0} TextGrids'.format(len(args))
+        print '\told reader: {0:.3f}s'.format(old_time)
+        print '\tnew reader: {0:.3f}s ({1:.1f}x)'.format(new_time,
+                                                      old_time / new_time)
+    finally:
+        if tmp_dir:
+            rmtree(tmp_dir)
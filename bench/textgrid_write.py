@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# textgrid_write.py: benchmark TextGrid.write against the old line writer
+#
+# Makes n synthetic TextGrids (or reads the TextGrid files given), writes
+# each with both writers in the long and short text formats, checks that
+# the output is byte-identical, and reports the time taken by each.
+#
+# USAGE: python bench/textgrid_write.py [-n 1000] [file.TextGrid ...]
+
+import os
+import sys
+import codecs
+
+from time import time
+from shutil import rmtree
+from tempfile import mkdtemp
+from getopt import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from textgrid import _quote, IntervalTier, PointTier, TextGrid, \
+                     TextGridFromFile
+
+
+def old_write(self, f, null='', format='long'):
+    """
+    TextGrid.write as it was before the buffered writer
+    """
+    sink = codecs.open(f, 'w', 'UTF-8')
+    maxT = self.maxTime
+    if not maxT:
+        maxT = max([t.bounds()[1] for t in self.tiers])
+    if format == 'long':
+        old_writeLong(self, sink, maxT, null)
+    else:
+        old_writeShort(self, sink, maxT, null)
+    sink.close()
+
+
+def old_writeLong(self, sink, maxT, null):
+    print >> sink, 'File type = "ooTextFile"'
+    print >> sink, 'Object class = "TextGrid"\n'
+    print >> sink, 'xmin = {0}'.format(self.minTime)
+    print >> sink, 'xmax = {0}'.format(maxT)
+    print >> sink, 'tiers? <exists>'
+    print >> sink, 'size = {0}'.format(len(self))
+    print >> sink, 'item []:'
+    for (i, tier) in enumerate(self.tiers, 1):
+        print >> sink, '\titem [{0}]:'.format(i)
+        if tier.__class__ == IntervalTier: 
+            print >> sink, '\t\tclass = "IntervalTier"'
+            print >> sink, u'\t\tname = {0}'.format(_quote(tier.name))
+            print >> sink, '\t\txmin = {0}'.format(tier.minTime)
+            print >> sink, '\t\txmax = {0}'.format(maxT)
+            output = tier._fillInTheGaps(null)
+            print >> sink, '\t\tintervals: size = {0}'.format(len(output))
+            for (j, interval) in enumerate(output, 1):
+                print >> sink, '\t\t\tintervals [{0}]:'.format(j)
+                print >> sink, '\t\t\t\txmin = {0}'.format(interval.minTime)
+                print >> sink, '\t\t\t\txmax = {0}'.format(interval.maxTime)
+                print >> sink, u'\t\t\t\ttext = {0}'.format(
+                                                    _quote(interval.mark))
+        elif tier.__class__ == PointTier:
+            print >> sink, '\t\tclass = "TextTier"'
+            print >> sink, u'\t\tname = {0}'.format(_quote(tier.name))
+            print >> sink, '\t\txmin = {0}'.format(tier.minTime)
+            print >> sink, '\t\txmax = {0}'.format(maxT)
+            print >> sink, '\t\tpoints: size = {0}'.format(len(tier))
+            for (k, point) in enumerate(tier, 1):
+                print >> sink, '\t\t\tpoints [{0}]:'.format(k)
+                print >> sink, '\t\t\t\ttime = {0}'.format(point.time)
+                print >> sink, u'\t\t\t\tmark = {0}'.format(
+                                                    _quote(point.mark))
+
+
+def old_writeShort(self, sink, maxT, null):
+    print >> sink, 'File type = "ooTextFile"'
+    print >> sink, 'Object class = "TextGrid"\n'
+    print >> sink, self.minTime
+    print >> sink, maxT
+    print >> sink, '<exists>'
+    print >> sink, len(self)
+    for tier in self.tiers:
+        if tier.__class__ == IntervalTier:
+            print >> sink, '"IntervalTier"'
+            print >> sink, _quote(tier.name)
+            print >> sink, tier.minTime
+            print >> sink, maxT
+            output = tier._fillInTheGaps(null)
+            print >> sink, len(output)
+            for interval in output:
+                print >> sink, interval.minTime
+                print >> sink, interval.maxTime
+                print >> sink, _quote(interval.mark)
+        elif tier.__class__ == PointTier:
+            print >> sink, '"TextTier"'
+            print >> sink, _quote(tier.name)
+            print >> sink, tier.minTime
+            print >> sink, maxT
+            print >> sink, len(tier)
+            for point in tier:
+                print >> sink, point.time
+                print >> sink, _quote(point.mark)
+
+
+def synthetic(i, n_words=30):
+    """
+    Makes a TextGrid like those align.py makes, with n_words words of 
+    four phones each, pauses between some of them, and a PointTier
+    """
+    grid = TextGrid(str(i))
+    phones = IntervalTier('phones')
+    words = IntervalTier('words')
+    points = PointTier('points')
+    t = .05
+    for w in xrange(n_words):
+        words.add(t, round(t + .4, 5), 'WORD{0}'.format(w) if w % 10 else
+                                       u'TW\xd6\nLINES')
+        points.add(round(t + .2, 5), 'P{0}'.format(w))
+        for p in xrange(4):
+            phones.add(t, round(t + .1, 5), 'AA1')
+            t = round(t + .1, 5)
+        if w % 7 == 0:
+            t = round(t + .15, 5)
+    grid.extend([phones, words, points])
+    return grid
+
+
+def timed(write, grids, paths, **kwargs):
+    start = time()
+    for (grid, path) in zip(grids, paths):
+        write(grid, path, **kwargs)
+    return time() - start
+
+
+def read_all(paths):
+    data = []
+    for path in paths:
+        with open(path, 'rb') as source:
+            data.append(source.read())
+    return data
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:')
+    n = 1000
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+    if args:
+        grids = [TextGridFromFile(path) for path in args]
+    else:
+        grids = [synthetic(i) for i in xrange(n)]
+    tmp_dir = mkdtemp()
+    try:
+        old_paths = [os.path.join(tmp_dir, '{0}.old'.format(i)) for i in
+                     xrange(len(grids))]
+        new_paths = [os.path.join(tmp_dir, '{0}.new'.format(i)) for i in
+                     xrange(len(grids))]
+        print 'Wrote {0} TextGrids'.format(len(grids))
+        for format in ('long', 'short'):
+            old_time = timed(old_write, grids, old_paths, format=format)
+            new_time = timed(TextGrid.write, grids, new_paths, 
+                             format=format)
+            if read_all(old_paths) != read_all(new_paths):
+                exit('Writers disagree ({0} format)'.format(format))
+            print '\t{0} format, byte-identical:'.format(format)
+            print '\t\told writer: {0:.3f}s'.format(old_time)
+            print '\t\tnew writer: {0:.3f}s ({1:.1f}x)'.format(new_time,
+                                                      old_time / new_time)
+    finally:
+        rmtree(tmp_dir)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# viterbi_align.py: benchmark viterbi.py's aligner on synthetic utterances
+#
+# Makes n utterances of a few random words from dictionary.txt, drawing the
+# features of each state of each phone (for a random number of frames) from
+# that state's Gaussian in MOD/, so that the true boundaries are known.
+# Then aligns them with viterbi.Decoder, checks that the phones found are
+# the ones used, and reports how many phone boundaries fall within each
+# tolerance of the truth, and the time taken.
+#
+# USAGE: python bench/viterbi_align.py [-n 100] [-w 5]
+
+import os
+import sys
+
+from time import time
+from getopt import getopt
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hmm import read_models
+from align import PronDict, CMU_PHONES, task_prons
+from viterbi import Decoder, SIL, SP, SHIFT
+
+TOLERANCES = (.01, .02, .05)
+
+
+def synthetic(models, the_dict, words, rng):
+    """
+    Returns the features of an utterance of words (with a "sp" after some
+    of them) between "sil"s, and the (end time, phone) of each phone but
+    "sp"
+    """
+    phones = [SIL]
+    for word in words:
+        phones.extend(the_dict[word][0])
+        if rng.rand() < .5:
+            phones.append(SP)
+    phones.append(SIL)
+    features = []
+    truth = []
+    n_frames = 0
+    for phone in phones:
+        for state in models[phone].states:
+            n = rng.randint(2, 8)
+            features.append(models.means[state] + rng.randn(n,
+                            models.vecsize) * np.sqrt(models.variances[state]))
+            n_frames += n
+        if phone != SP:
+            truth.append((round(n_frames * SHIFT, 5), phone))
+    return (np.vstack(features), truth)
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:w:')
+    n = 100
+    n_words = 5
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-w':
+            n_words = int(val)
+    rng = np.random.RandomState(0)
+    models = read_models(os.path.join('MOD', 'macros'),
+                         os.path.join('MOD', 'hmmdefs'))
+    the_dict = PronDict('dictionary.txt', CMU_PHONES)
+    vocabulary = [the_dict.d._word(i) for i in xrange(len(the_dict.d))]
+    utterances = []
+    for i in xrange(n):
+        words = [vocabulary[j] for j in
+                 rng.randint(len(vocabulary), size=n_words)]
+        (features, truth) = synthetic(models, the_dict, words, rng)
+        utterances.append((words, features, truth))
+    decoder = Decoder(models)
+    errors = []
+    n_frames = 0
+    start = time()
+    for (i, (words, features, truth)) in enumerate(utterances):
+        (grid, score) = decoder.align(str(i), features,
+                                      [(word, task_prons(the_dict, word))
+                                       for word in words])
+        if grid is None:
+            exit('No path found for utterance {0}'.format(i))
+        found = [(interval.maxTime, interval.mark) for interval in
+                 grid.getFirst('phones')]
+        if [phone for (_, phone) in found] != \
+           [phone for (_, phone) in truth]:
+            exit('Phones disagree for utterance {0}'.format(i))
+        errors.extend(abs(t1 - t2) for ((t1, _), (t2, _)) in
+                      zip(found[:-1], truth[:-1]))
+        n_frames += len(features)
+    elapsed = time() - start
+    errors = np.array(errors)
+    print 'Aligned {0} utterances ({1} frames) in {2:.3f}s ' \
+          '({3:.2f} ms per utterance)'.format(n, n_frames, elapsed,
+                                              1000. * elapsed / n)
+    for tolerance in TOLERANCES:
+        print '\tboundaries within {0:g} ms: {1:.4f}'.format(
+                1000 * tolerance, np.mean(errors < tolerance + 1e-9))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# viterbi_hvite.py: compare viterbi.py's alignments with HVite's
+#
+# Makes n fixed utterances as viterbi_align.py does (features drawn from
+# the states of the models in MOD/, with a fixed seed), writes them as HTK
+# parameter files, and aligns them both with HVite, run with the same
+# options, task dictionary, and models that align.py gives it, and with
+# viterbi.Decoder. Then reports how many of their phone boundaries agree
+# within each tolerance, and exits with an error if fewer than -a of
+# them agree within the first. This needs HTK's HVite in the PATH; the
+# stand-in in fakehtk/ runs, to check the plumbing, but its alignments are
+# meaningless.
+#
+# USAGE: python bench/viterbi_hvite.py [-n 20] [-w 5] [-a .95]
+
+import os
+import sys
+
+from time import time
+from getopt import getopt
+from shutil import rmtree
+from tempfile import mkdtemp
+from subprocess import check_call
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from mfcc import write_htk
+from hmm import read_models
+from eval import boundaries
+from textgrid import MLF
+from viterbi import Decoder, SIL
+from align import PronDict, CMU_PHONES, MFCC_CFG, PRUNING, MACROS, \
+                  HMMDEFS, task_prons, htk_escape
+from viterbi_align import synthetic, TOLERANCES
+
+
+def which(command):
+    for path in os.environ['PATH'].split(os.pathsep):
+        candidate = os.path.join(path, command)
+        if os.access(candidate, os.X_OK):
+            return os.path.realpath(candidate)
+    return None
+
+
+def hvite(utterances, the_dict, tmp_dir):
+    """
+    Aligns utterances, (name, words, features) triples, with HVite, and
+    returns a dict mapping each name to its TextGrid
+    """
+    lab_dir = os.path.join(tmp_dir, 'LAB')
+    os.mkdir(lab_dir)
+    scp = os.path.join(tmp_dir, 'test.scp')
+    word_mlf = os.path.join(tmp_dir, 'words.mlf')
+    found_words = set()
+    with open(scp, 'w') as scp_sink:
+        with open(word_mlf, 'w') as mlf_sink:
+            print >> mlf_sink, '#!MLF!#'
+            for (name, words, features) in utterances:
+                mfc = os.path.join(tmp_dir, name + '.mfc')
+                write_htk(mfc, features)
+                print >> scp_sink, '"{0}"'.format(mfc)
+                print >> mlf_sink, '"*/{0}.lab"'.format(name)
+                for word in words:
+                    print >> mlf_sink, htk_escape(word)
+                print >> mlf_sink, '.'
+                found_words.update(words)
+    # the task dictionary and phone list, as align.py makes them
+    taskdict = os.path.join(tmp_dir, 'taskdict')
+    phones = set([SIL])
+    with open(taskdict, 'w') as sink:
+        for word in sorted(found_words):
+            for pron in task_prons(the_dict, word):
+                phones.update(pron)
+                print >> sink, '{0} {1}'.format(htk_escape(word),
+                                                ' '.join(pron))
+        print >> sink, '{0} {0}'.format(SIL)
+    phone_list = os.path.join(tmp_dir, 'phones')
+    with open(phone_list, 'w') as sink:
+        for phone in sorted(phones):
+            print >> sink, phone
+    cfg = os.path.join(tmp_dir, 'cfg')
+    with open(cfg, 'w') as sink:
+        print >> sink, MFCC_CFG
+    mlf = os.path.join(tmp_dir, 'align.mlf')
+    with open(os.devnull, 'w') as sink:
+        check_call(['HVite', '-a', '-m', '-y', 'lab', '-o', 'SM',
+                    '-b', SIL, '-i', mlf, '-L', lab_dir, '-C', cfg,
+                    '-S', scp, '-H', os.path.join('MOD', MACROS),
+                    '-H', os.path.join('MOD', HMMDEFS), '-I', word_mlf,
+                    '-t'] + PRUNING + [taskdict, phone_list], stdout=sink)
+    return dict((os.path.splitext(os.path.basename(grid.name))[0], grid)
+                for grid in MLF(mlf))
+
+
+if __name__ == '__main__':
+    (opts, args) = getopt(sys.argv[1:], 'n:w:a:')
+    n = 20
+    n_words = 5
+    minimum = .95
+    for (opt, val) in opts:
+        if opt == '-n':
+            n = int(val)
+        elif opt == '-w':
+            n_words = int(val)
+        elif opt == '-a':
+            minimum = float(val)
+    command = which('HVite')
+    if command is None:
+        exit('HVite not found')
+    if os.path.dirname(command) == os.path.realpath(os.path.join(
+                                   os.path.dirname(__file__), 'fakehtk')):
+        print 'HVite is the stand-in in fakehtk/: agreement is meaningless'
+    rng = np.random.RandomState(0)
+    models = read_models(os.path.join('MOD', MACROS),
+                         os.path.join('MOD', HMMDEFS))
+    the_dict = PronDict('dictionary.txt', CMU_PHONES)
+    vocabulary = [the_dict.d._word(i) for i in xrange(len(the_dict.d))]
+    utterances = []
+    for i in xrange(n):
+        words = [vocabulary[j] for j in
+                 rng.randint(len(vocabulary), size=n_words)]
+        (features, _) = synthetic(models, the_dict, words, rng)
+        utterances.append(('utt{0:04d}'.format(i), words,
+                           features.astype(np.float32)))
+    tmp_dir = mkdtemp()
+    try:
+        start = time()
+        references = hvite(utterances, the_dict, tmp_dir)
+        hvite_time = time() - start
+    finally:
+        rmtree(tmp_dir)
+    decoder = Decoder(models)
+    errors = []
+    (n_missing, n_mismatched) = (0, 0)
+    start = time()
+    for (name, words, features) in utterances:
+        (grid, _) = decoder.align(name, features,
+                                  [(word, task_prons(the_dict, word))
+                                   for word in words])
+        if grid is None or name not in references:
+            n_missing += 1
+            continue
+        ours = boundaries(grid, 'phones')
+        theirs = boundaries(references[name], 'phones')
+        if [b.transition for b in ours] != [b.transition for b in theirs]:
+            n_mismatched += 1
+            continue
+        errors.extend(abs(b1.time - b2.time) for (b1, b2) in
+                      zip(ours, theirs))
+    viterbi_time = time() - start
+    print 'Aligned {0} utterances: HVite {1:.3f}s, viterbi.py ' \
+          '{2:.3f}s'.format(n, hvite_time, viterbi_time)
+    print '\tnot aligned by one or the other: {0}'.format(n_missing)
+    print '\tdifferent phones: {0}'.format(n_mismatched)
+    if not errors:
+        exit('No boundaries to compare')
+    errors = np.array(errors)
+    for tolerance in TOLERANCES:
+        print '\tboundaries within {0:g} ms: {1:.4f}'.format(
+                1000 * tolerance, np.mean(errors < tolerance + 1e-9))
+    if np.mean(errors < TOLERANCES[0] + 1e-9) < minimum:
+        exit('Fewer than {0:g} of boundaries agree within {1:g} ms'.format(
+             minimum, 1000 * TOLERANCES[0]))
@@ -6,12 +6,28 @@ from __future__ import division
 
 from textgrid import TextGridFromFile
 
+import os
+
 from sys import argv, stderr
+from glob import glob
 from collections import namedtuple
 from getopt import getopt, GetoptError
 
+try:  # only needed for corpora
+    import numpy as np
+except ImportError:
+    np = None
+
+
+USAGE = """USAGE: {0} [-s 20] [-t phones] TGrid1 TGrid2
+       {0} [-s 10,20,50] [-t phones] TGridDir1/ TGridDir2/
+       {0} [-s 10,20,50] [-t phones] -m manifest.txt
 
-USAGE = """USAGE: {} [-s 20] [-t phones] TGrid1 TGrid2""".format(__file__)
+The first form compares two TextGrids. The others compare whole corpora:
+the TextGrids with the same names in two directories, or the pairs of
+TextGrids on the tab-separated lines of a manifest file, and report
+agreement per file, per transition type, and overall. -s gives one or
+more tolerances in milliseconds.""".format(__file__)
 
 CLOSE_ENOUGH = 20
 TIER_NAME = "phones"
@@ -21,14 +37,14 @@ boundary = namedtuple("boundary", ["transition", "time"])
 
 def boundaries(textgrid, tier_name):
     """
-    Extract a single tier named `tier_name` from the TextGrid object 
+    Extract a single tier named `tier_name` from the TextGrid object
     `textgrid`, and then convert that IntervalTier to boundaries
     """
     tiers = textgrid.getList(tier_name)
     if not tiers:
-        exit('TextGrid has no "{}" tier.'.format(tier_name))
+        raise ValueError('TextGrid has no "{}" tier.'.format(tier_name))
     if len(tiers) > 1:
-        exit('TextGrid has many "{}" tiers.'.format(tier_name))
+        raise ValueError('TextGrid has many "{}" tiers.'.format(tier_name))
     tier = tiers[0]
     boundaries = []
     for (interval1, interval2) in zip(tier, tier[1:]):
@@ -45,42 +61,198 @@ def is_close_enough(tx, ty, close_enough):
     return abs(tx - ty) < close_enough
 
 
+def paired(dir1, dir2):
+    """
+    Return the (path1, path2) pairs of TextGrids with the same name in
+    `dir1` and `dir2`, warning about those only found in `dir1`
+    """
+    pairs = []
+    for path1 in sorted(glob(os.path.join(dir1, '*.TextGrid'))):
+        path2 = os.path.join(dir2, os.path.basename(path1))
+        if os.path.exists(path2):
+            pairs.append((path1, path2))
+        else:
+            print >> stderr, 'Skipping {}: no {}'.format(path1, path2)
+    return pairs
+
+
+def read_manifest(path):
+    """
+    Return the (path1, path2) pairs on the tab-separated lines of the
+    manifest file `path`
+    """
+    pairs = []
+    with open(path, 'r') as source:
+        for (i, line) in enumerate(source, 1):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            fields = line.split('\t')
+            if len(fields) != 2:
+                raise ValueError('{}:{}: not a pair of paths'.format(path,
+                                                                     i))
+            pairs.append(tuple(fields))
+    return pairs
+
+
+def load_corpus(pairs, tier_name):
+    """
+    Read the boundaries of each pair of TextGrids in `pairs`, skipping
+    (with a warning) any pair whose tiers do not match, and return the
+    paths of the pairs used, the transition types, and NumPy arrays of
+    the index of the pair and of the transition type for each boundary,
+    and of its times in the first and the second TextGrid
+    """
+    paths = []
+    transitions = {}
+    (file_ids, transition_ids, times1, times2) = ([], [], [], [])
+    for (path1, path2) in pairs:
+        try:
+            first = boundaries(TextGridFromFile(path1), tier_name)
+            secnd = boundaries(TextGridFromFile(path2), tier_name)
+            if len(first) != len(secnd):
+                raise ValueError("Tiers lengths do not match.")
+            if any(boundary1.transition != boundary2.transition for
+                   (boundary1, boundary2) in zip(first, secnd)):
+                raise ValueError("Tier labels do not match.")
+        except (EnvironmentError, ValueError, StopIteration) as err:
+            print >> stderr, 'Skipping {}: {}'.format(path1, err)
+            continue
+        file_ids.extend([len(paths)] * len(first))
+        paths.append(path1)
+        for (boundary1, boundary2) in zip(first, secnd):
+            transition_ids.append(transitions.setdefault(
+                                  boundary1.transition, len(transitions)))
+            times1.append(boundary1.time)
+            times2.append(boundary2.time)
+    transitions = sorted(transitions, key=transitions.get)
+    return (paths, transitions, np.array(file_ids, dtype=int),
+            np.array(transition_ids, dtype=int), np.array(times1),
+            np.array(times2))
+
+
+def count_agreement(errors, groups, n_groups, tolerances):
+    """
+    Given the absolute `errors` of a set of boundaries, each in one of
+    `n_groups` `groups`, return the number of boundaries in each group,
+    the number within each of the `tolerances` (as a matrix with a row
+    for each group), and the mean error in each group
+    """
+    tolerances = np.asarray(tolerances)
+    hits = errors[:, np.newaxis] < tolerances  # boundaries x tolerances
+    # count the hits for each group and tolerance in a single pass
+    cells = groups[:, np.newaxis] * len(tolerances) + \
+            np.arange(len(tolerances))
+    hits = np.bincount(cells.ravel(), weights=hits.ravel(),
+                       minlength=n_groups * len(tolerances))
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=errors, minlength=n_groups)
+    return (counts, hits.reshape(n_groups, len(tolerances)),
+            sums / np.maximum(counts, 1))
+
+
+def print_table(heading, names, tolerances, counts, hits, means):
+    """
+    Print a tab-separated table of agreement for each of `names`
+    """
+    print '\t'.join([heading, 'boundaries'] +
+                    ['<{:g}ms'.format(1000 * tolerance) for tolerance in
+                     tolerances] + ['mean error (ms)'])
+    for (name, count, row, mean) in zip(names, counts, hits, means):
+        print '\t'.join([name, str(count)] +
+                        ['{:.4f}'.format(hit / count if count else 0.)
+                         for hit in row] + ['{:.2f}'.format(1000 * mean)])
+
+
+def evaluate_corpus(pairs, tier_name, tolerances):
+    """
+    Compute and print agreement for the TextGrid `pairs` per file, per
+    transition type, and overall
+    """
+    (paths, transitions, file_ids, transition_ids, times1, times2) = \
+                                            load_corpus(pairs, tier_name)
+    if not len(times1):
+        exit("No boundaries to compare.")
+    errors = np.abs(times1 - times2)
+    print_table('file', [os.path.basename(path) for path in paths],
+                tolerances,
+                *count_agreement(errors, file_ids, len(paths), tolerances))
+    print
+    (counts, hits, means) = count_agreement(errors, transition_ids,
+                                            len(transitions), tolerances)
+    order = np.argsort(-counts, kind='mergesort')  # most frequent first
+    print_table('transition', [transitions[i] for i in order], tolerances,
+                counts[order], hits[order], means[order])
+    print
+    print_table('corpus', ['all'], tolerances,
+                *count_agreement(errors, np.zeros(len(errors), dtype=int),
+                                 1, tolerances))
+    print 'Median error: {:.2f} ms'.format(1000 * np.median(errors))
+
+
 if __name__ == "__main__":
     # check args
     tier_name = TIER_NAME
-    close_enough = CLOSE_ENOUGH / 1000
-    (opts, args) = getopt(argv[1:], 's:t:')
-    if len(args) != 2:
-        print >> stderr, USAGE
-        exit("Not enough TextGrids provided")
+    tolerances = [CLOSE_ENOUGH / 1000]
+    manifest = None
     try:
+        (opts, args) = getopt(argv[1:], 'm:s:t:')
         for (opt, val) in opts:
-            if opt == '-s':
-                close_enough = int(val) / 1000
+            if opt == '-m':
+                manifest = val
+            elif opt == '-s':
+                tolerances = [int(ms) / 1000 for ms in val.split(',')]
             elif opt == '-t':
                 tier_name = val
             else:
                 raise GetoptError
-    except (TypeError, GetoptError) as err:
+    except (TypeError, ValueError, GetoptError) as err:
         print >> stderr, USAGE
         exit(str(err))
+    if len(args) != (0 if manifest else 2):
+        print >> stderr, USAGE
+        exit("Not enough TextGrids provided")
+    # evaluate a corpus
+    if manifest or os.path.isdir(args[0]):
+        if np is None:
+            exit("Comparing corpora requires NumPy.")
+        try:
+            if manifest:
+                pairs = read_manifest(manifest)
+            elif os.path.isdir(args[1]):
+                pairs = paired(*args)
+            else:
+                raise ValueError("{} is not a directory.".format(args[1]))
+        except (EnvironmentError, ValueError) as err:
+            exit(str(err))
+        evaluate_corpus(pairs, tier_name, tolerances)
+        exit(0)
     # get boundaries
-    first = boundaries(TextGridFromFile(args[0]), tier_name)
-    secnd = boundaries(TextGridFromFile(args[1]), tier_name)
-    # count
+    try:
+        first = boundaries(TextGridFromFile(args[0]), tier_name)
+        secnd = boundaries(TextGridFromFile(args[1]), tier_name)
+    except ValueError as err:
+        exit(str(err))
+    # check
     if len(first) != len(secnd):
         exit("Tiers lengths do not match.")
-    concordant = 0
-    discordant = 0
-    for (boundary1, boundary2) in zip(first, secnd):
-        if boundary1.transition != boundary2.transition:
-            exit("Tier labels do not match.")
-        if is_close_enough(boundary1.time, boundary2.time, close_enough):
-            concordant += 1
-        else:
-            discordant += 1
-    # print out
-    agreement = concordant / (concordant + discordant)
-    print '{} "close enough" boundaries, {} incorrect boundaries'.format(
-                                         concordant, discordant)
-    print 'Agreement: {:.4f}'.format(agreement)
+    if any(boundary1.transition != boundary2.transition for
+           (boundary1, boundary2) in zip(first, secnd)):
+        exit("Tier labels do not match.")
+    # count
+    for close_enough in tolerances:
+        if len(tolerances) > 1:
+            print 'Within {:g} ms:'.format(1000 * close_enough)
+        concordant = 0
+        discordant = 0
+        for (boundary1, boundary2) in zip(first, secnd):
+            if is_close_enough(boundary1.time, boundary2.time,
+                               close_enough):
+                concordant += 1
+            else:
+                discordant += 1
+        # print out
+        agreement = concordant / (concordant + discordant)
+        print '{} "close enough" boundaries, {} incorrect boundaries'.format(
+                                             concordant, discordant)
+        print 'Agreement: {:.4f}'.format(agreement)
@@ -0,0 +1,531 @@
+#!/usr/bin/env python
+# hmm.py: HTK model definitions (hmmdefs and macros) as NumPy arrays
+#
+# A set of models is read into a pool of states, held as matrices of
+# means and variances (one row per state) and a vector of gconsts, and a
+# list of HMMs, each of which names the rows of its emitting states and
+# has its own transition matrix. States shared with ~s macros (e.g.,
+# "silst") are a single row, used by every HMM which refers to them. Only
+# what align.py produces is supported: single-Gaussian, diagonal-
+# covariance models with a single stream. Gaussians scores frames of
+# features against the states, all at once.
+#
+# USAGE: python hmm.py [-o out_dir/] MOD/macros MOD/hmmdefs [...]
+#
+# prints a summary of the models in the given files; with -o, they are
+# also written, together, to "macros" and "hmmdefs" in out_dir.
+
+import os
+import re
+
+from sys import argv, stderr, exit
+from getopt import getopt, GetoptError
+
+import numpy as np
+
+LOG_2PI = np.log(2. * np.pi)
+
+# keywords are <...>, names may or may not be quoted, and anything else is
+# a number (or a macro type); "<VECSIZE> 39<NULLD>" is three tokens
+_TOKEN = re.compile(r'<[^>]*>|"(?:[^"\\]|\\.)*"|[^\s<]+')
+
+
+def compute_gconst(variances):
+    """
+    Computes the gconst (the log of the normalizing constant, as HTK
+    stores it) of diagonal Gaussians with the given variances, which may
+    be a vector or a matrix with one Gaussian per row
+    """
+    variances = np.asarray(variances)
+    return variances.shape[-1] * LOG_2PI + np.log(variances).sum(axis=-1)
+
+
+def _unquote(name):
+    if name.startswith('"'):
+        return name[1:-1]
+    return name
+
+
+def _vector(values, width):
+    # HTK's format: each value preceded by a space
+    return (' %e' * width) % tuple(values) + '\n'
+
+
+class Gaussians(object):
+    """
+    Diagonal-covariance Gaussians, one per row of means and variances, for
+    scoring many frames at once. The log likelihood of a frame x given a
+    Gaussian is -(gconst + sum((x - mean) ** 2 / variance)) / 2; expanding
+    the square, that is -(x ** 2 . 1 / variance - 2 x . mean / variance +
+    sum(mean ** 2 / variance) + gconst) / 2, so with 1 / variance, mean /
+    variance, and the constant terms computed once, here, a matrix of
+    frames can be scored against all of the Gaussians with two matrix
+    products. Frames are scored in chunks, to bound the memory used by
+    the temporaries.
+
+    >>> gaussians = Gaussians([[0., 0.], [1., 2.]], [[1., 1.], [.5, 2.]])
+    >>> features = np.array([[0., 0.], [1., 1.], [2., 3.]])
+    >>> naive = [[-.5 * (gconst + ((x - mean) ** 2 / variance).sum())
+    ...           for (mean, variance, gconst) in zip(gaussians.means,
+    ...           gaussians.variances, gaussians.gconsts)] for x in features]
+    >>> np.allclose(gaussians.log_likelihoods(features), naive)
+    True
+    >>> np.allclose(gaussians.log_likelihoods(features, chunk_size=2), naive)
+    True
+    """
+
+    # frames scored at a time; the temporaries for each chunk are chunk_size
+    # x the number of Gaussians (or dimensions)
+    CHUNK_SIZE = 1024
+
+    def __init__(self, means, variances, gconsts=None):
+        self.means = np.asarray(means, dtype=float)
+        self.variances = np.asarray(variances, dtype=float)
+        if gconsts is None:
+            gconsts = compute_gconst(self.variances)
+        self.gconsts = np.asarray(gconsts, dtype=float)
+        # the terms of the expansion, with the factor of -1 / 2 folded in,
+        # transposed so that features (frames x dimensions) multiply them
+        inv_variances = 1. / self.variances
+        self.square = np.ascontiguousarray(-.5 * inv_variances.T)
+        self.linear = np.ascontiguousarray((self.means * inv_variances).T)
+        self.constant = -.5 * (self.gconsts + (self.means * self.means *
+                                               inv_variances).sum(axis=1))
+
+    def __len__(self):
+        return len(self.means)
+
+    def chunks(self, features, chunk_size=CHUNK_SIZE):
+        """
+        Yields the index of the first frame of each chunk of (at most)
+        chunk_size frames of features, and the log likelihood of each of
+        those frames given each Gaussian, as a frames x Gaussians matrix
+        """
+        features = np.asarray(features, dtype=float)
+        for start in xrange(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            scores = np.dot(chunk * chunk, self.square)
+            scores += np.dot(chunk, self.linear)
+            scores += self.constant
+            yield (start, scores)
+
+    def log_likelihoods(self, features, chunk_size=CHUNK_SIZE):
+        """
+        Returns the log likelihood of each frame of features (one row per
+        frame) given each Gaussian, as a frames x Gaussians matrix, scoring
+        chunk_size frames at a time
+        """
+        result = np.empty((len(features), len(self)))
+        for (start, scores) in self.chunks(features, chunk_size):
+            result[start:start + len(scores)] = scores
+        return result
+
+
+class HMM(object):
+    """
+    An HMM in an HMMSet: its name, the indices of its emitting states in
+    the HMMSet's state pool (states 2 through N - 1, in order), and its
+    N x N transition matrix. If the transition matrix was shared with a
+    ~t macro, transp_name is the macro's name.
+    """
+    __slots__ = ('name', 'states', 'transp', 'transp_name')
+
+    def __init__(self, name, states, transp, transp_name=None):
+        self.name = name
+        self.states = list(states)
+        self.transp = np.asarray(transp, dtype=float)
+        self.transp_name = transp_name
+
+    def __repr__(self):
+        return 'HMM({0!r}, {1!r})'.format(self.name, self.states)
+
+    def __len__(self):
+        return len(self.states) + 2
+
+
+class HMMSet(object):
+    """
+    A set of HMMs, as read from (any number of) HTK model files. The
+    state pool is stored as the matrices means and variances and the
+    vector gconsts, one row for each state, and state_names gives the name
+    of the ~s macro for each state (or None). Mean macros (~u) are kept
+    in mean_macros, variance macros (~v, e.g., "varFloor1") in
+    variance_macros, and the global options (~o)
+    in vecsize, streams (the <STREAMINFO>, if any), and kinds (the other
+    keywords, e.g., ["NULLD", "MFCC_D_A_0", "DIAGC"]).
+    """
+
+    def __init__(self):
+        self.vecsize = None
+        self.streams = None
+        self.kinds = []
+        self.means = np.empty((0, 0))
+        self.variances = np.empty((0, 0))
+        self.gconsts = np.empty(0)
+        self.state_names = []
+        self.mean_macros = {}
+        self.variance_macros = {}
+        self.transp_macros = {}
+        self.hmms = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.hmms)
+
+    def __iter__(self):
+        return iter(self.hmms)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        return self.hmms[self._index[name]]
+
+    def __repr__(self):
+        return 'HMMSet({0!r})'.format([hmm.name for hmm in self.hmms])
+
+    def gaussians(self, states=None):
+        """
+        Returns the Gaussians of the states in the pool with the given
+        indices (by default, all of them), for scoring frames
+        """
+        if states is None:
+            return Gaussians(self.means, self.variances, self.gconsts)
+        return Gaussians(self.means[states], self.variances[states],
+                         self.gconsts[states])
+
+    def add_state(self, mean, variance, gconst=None, name=None):
+        """
+        Adds a state to the pool, computing its gconst if it is not given,
+        and returns its index
+        """
+        if gconst is None:
+            gconst = compute_gconst(variance)
+        self._extend([mean], [variance], [gconst], [name])
+        return len(self.state_names) - 1
+
+    def add_hmm(self, name, states, transp, transp_name=None):
+        """
+        Adds (or replaces) the HMM name, with the emitting states at the
+        given indices in the state pool, and returns it
+        """
+        hmm = HMM(name, states, transp, transp_name)
+        if len(hmm.transp) != len(hmm):
+            raise ValueError('HMM "{0}" has {1} states '.format(name,
+                                                               len(hmm)) +
+                             'but a {0} x {0} '.format(len(hmm.transp)) +
+                             'transition matrix')
+        if name in self._index:
+            self.hmms[self._index[name]] = hmm
+        else:
+            self._index[name] = len(self.hmms)
+            self.hmms.append(hmm)
+        return hmm
+
+    def _extend(self, means, variances, gconsts, names):
+        if not names:
+            return
+        means = np.asarray(means, dtype=float)
+        if self.state_names:
+            self.means = np.vstack((self.means, means))
+            self.variances = np.vstack((self.variances, variances))
+            self.gconsts = np.concatenate((self.gconsts, gconsts))
+        else:
+            self.means = means
+            self.variances = np.asarray(variances, dtype=float)
+            self.gconsts = np.asarray(gconsts, dtype=float)
+        self.state_names.extend(names)
+
+    ## reading
+
+    def read(self, f):
+        """
+        Reads the macros and HMMs in the file f (a path or a file object)
+        into this set. Mean and variance macros (~u and ~v) used within a
+        state are copied into it, so they are not shared when written.
+
+        >>> from StringIO import StringIO
+        >>> models = HMMSet()
+        >>> models.read(StringIO('''~u "m" <MEAN> 2 1.0 2.0
+        ... ~h "a" <BEGINHMM> <NUMSTATES> 3 <STATE> 2
+        ... ~u "m" <VARIANCE> 2 1.0 1.0
+        ... <TRANSP> 3 0 1 0 0 .5 .5 0 0 0 <ENDHMM>
+        ... ~h "b" <BEGINHMM> <NUMSTATES> 3 <STATE> 2
+        ... ~u "m" <VARIANCE> 2 2.0 2.0
+        ... <TRANSP> 3 0 1 0 0 .5 .5 0 0 0 <ENDHMM>'''))
+        >>> models.mean_macros['m']
+        array([1., 2.])
+        >>> models.means
+        array([[1., 2.],
+               [1., 2.]])
+        """
+        if hasattr(f, 'read'):
+            text = f.read()
+        else:
+            with open(f, 'r') as source:
+                text = source.read()
+        tokens = _TOKEN.findall(text)
+        # the new states, to be added to the pool all at once
+        self._pending = ([], [], [], [])
+        self._named = dict((name, i) for (i, name) in
+                           enumerate(self.state_names) if name)
+        i = 0
+        try:
+            while i < len(tokens):
+                macro = tokens[i]
+                if macro == '~o':
+                    i = self._options(tokens, i + 1)
+                    continue
+                name = _unquote(tokens[i + 1])
+                i += 2
+                if macro == '~h':
+                    i = self._hmm(name, tokens, i)
+                elif macro == '~s':
+                    (_, i) = self._state(tokens, i, name)
+                elif macro == '~u':
+                    (self.mean_macros[name], i) = self._array(tokens, i,
+                                                              '<MEAN>')
+                elif macro == '~v':
+                    (self.variance_macros[name], i) = self._array(tokens, i,
+                                                                  '<VARIANCE>')
+                elif macro == '~t':
+                    (self.transp_macros[name], i) = self._transp(tokens, i)
+                else:
+                    raise ValueError('Unsupported macro {0}'.format(macro))
+        except IndexError:
+            raise ValueError('Unexpected end of model file')
+        finally:
+            self._extend(*self._pending)
+            del self._pending, self._named
+
+    def _options(self, tokens, i):
+        while i < len(tokens) and not tokens[i].startswith('~'):
+            keyword = tokens[i].upper()
+            if keyword == '<STREAMINFO>':
+                n = int(tokens[i + 1])
+                self.streams = tuple(int(width) for width in
+                                     tokens[i + 2:i + 2 + n])
+                i += 2 + n
+            elif keyword == '<VECSIZE>':
+                self.vecsize = int(tokens[i + 1])
+                i += 2
+            elif keyword in ('<BEGINHMM>', '<NUMSTATES>'):
+                break  # options inside an HMM
+            else:
+                if keyword[1:-1] not in self.kinds:
+                    self.kinds.append(keyword[1:-1])
+                i += 1
+        return i
+
+    def _array(self, tokens, i, keyword, shape=None):
+        if tokens[i].upper() != keyword:
+            raise ValueError('Expected {0}, found {1}'.format(keyword,
+                                                             tokens[i]))
+        n = int(tokens[i + 1])
+        size = n * n if shape == 'square' else n
+        values = np.array(tokens[i + 2:i + 2 + size], dtype=float)
+        if len(values) != size:
+            raise IndexError
+        if shape == 'square':
+            values = values.reshape(n, n)
+        return (values, i + 2 + size)
+
+    def _transp(self, tokens, i):
+        return self._array(tokens, i, '<TRANSP>', 'square')
+
+    def _state(self, tokens, i, name=None):
+        """
+        Reads a state (or a reference to a ~s macro), adding it to the
+        pending states if it is new, and returns its index in the pool
+        """
+        if tokens[i] == '~s':
+            ref = _unquote(tokens[i + 1])
+            if ref not in self._named:
+                raise ValueError('Undefined state macro "{0}"'.format(ref))
+            return (self._named[ref], i + 2)
+        keyword = tokens[i].upper()
+        if keyword == '<NUMMIXES>':
+            if tokens[i + 1] != '1':
+                raise ValueError('Only single-Gaussian states are supported')
+            i += 2
+            keyword = tokens[i].upper()
+        if keyword == '<MIXTURE>':
+            i += 3
+        if tokens[i] == '~u':
+            mean = self._macro(tokens[i + 1], 'mean')
+            i += 2
+        else:
+            (mean, i) = self._array(tokens, i, '<MEAN>')
+        if tokens[i] == '~v':
+            variance = self._macro(tokens[i + 1], 'variance')
+            i += 2
+        else:
+            (variance, i) = self._array(tokens, i, '<VARIANCE>')
+        if i < len(tokens) and tokens[i].upper() == '<GCONST>':
+            value = float(tokens[i + 1])
+            i += 2
+        else:
+            value = compute_gconst(variance)
+        (means, variances, gconsts, names) = self._pending
+        means.append(mean)
+        variances.append(variance)
+        gconsts.append(value)
+        names.append(name)
+        index = len(self.state_names) + len(names) - 1
+        if name:
+            self._named[name] = index
+        return (index, i)
+
+    def _macro(self, name, kind):
+        name = _unquote(name)
+        if kind == 'mean' and name in self.mean_macros:
+            return self.mean_macros[name]
+        if kind == 'variance' and name in self.variance_macros:
+            return self.variance_macros[name]
+        raise ValueError('Undefined {0} macro "{1}"'.format(kind, name))
+
+    def _hmm(self, name, tokens, i):
+        if tokens[i].upper() != '<BEGINHMM>':
+            raise ValueError('Expected <BEGINHMM> for "{0}"'.format(name))
+        i = self._options(tokens, i + 1)
+        if tokens[i].upper() != '<NUMSTATES>':
+            raise ValueError('Expected <NUMSTATES> for "{0}"'.format(name))
+        n = int(tokens[i + 1])
+        i += 2
+        states = [None] * (n - 2)
+        while tokens[i].upper() == '<STATE>':
+            (states[int(tokens[i + 1]) - 2], i) = self._state(tokens, i + 2)
+        if None in states:
+            raise ValueError('HMM "{0}" is missing states'.format(name))
+        transp_name = None
+        if tokens[i] == '~t':
+            transp_name = _unquote(tokens[i + 1])
+            if transp_name not in self.transp_macros:
+                raise ValueError('Undefined transition matrix macro ' +
+                                 '"{0}"'.format(transp_name))
+            transp = self.transp_macros[transp_name]
+            i += 2
+        else:
+            (transp, i) = self._transp(tokens, i)
+        if tokens[i].upper() != '<ENDHMM>':
+            raise ValueError('Expected <ENDHMM> for "{0}"'.format(name))
+        self.add_hmm(name, states, transp, transp_name)
+        return i + 1
+
+    ## writing
+
+    def _write(self, f, chunks):
+        if hasattr(f, 'write'):
+            f.write(''.join(chunks))
+        else:
+            with open(f, 'w') as sink:
+                sink.write(''.join(chunks))
+
+    def _options_chunks(self):
+        if self.vecsize is None:
+            return []
+        chunks = ['~o\n']
+        if self.streams:
+            chunks.append('<STREAMINFO> {0} {1}\n'.format(len(self.streams),
+                          ' '.join(str(width) for width in self.streams)))
+        chunks.append('<VECSIZE> {0}'.format(self.vecsize))
+        chunks.extend('<{0}>'.format(kind) for kind in self.kinds)
+        chunks.append('\n')
+        return chunks
+
+    def _state_chunks(self, i):
+        width = self.means.shape[1]
+        return ['<MEAN> {0}\n'.format(width),
+                _vector(self.means[i], width),
+                '<VARIANCE> {0}\n'.format(width),
+                _vector(self.variances[i], width),
+                '<GCONST> %e\n' % self.gconsts[i]]
+
+    def _transp_chunks(self, transp):
+        n = len(transp)
+        return ['<TRANSP> {0}\n'.format(n)] + [_vector(row, n) for row in
+                                               transp]
+
+    def write_macros(self, f):
+        """
+        Writes the global options and the mean and variance macros (i.e.,
+        HTK's "macros" file) to f, a path or a file object
+        """
+        chunks = self._options_chunks()
+        for (name, mean) in sorted(self.mean_macros.items()):
+            chunks.append('~u "{0}"\n<MEAN> {1}\n'.format(name, len(mean)))
+            chunks.append(_vector(mean, len(mean)))
+        for (name, variance) in sorted(self.variance_macros.items()):
+            chunks.append('~v "{0}"\n<VARIANCE> {1}\n'.format(name,
+                                                          len(variance)))
+            chunks.append(_vector(variance, len(variance)))
+        self._write(f, chunks)
+
+    def write_hmmdefs(self, f):
+        """
+        Writes the global options, the state and transition matrix macros,
+        and the HMMs (i.e., HTK's "hmmdefs" file) to f, a path or a file
+        object
+        """
+        chunks = self._options_chunks()
+        for (i, name) in enumerate(self.state_names):
+            if name:
+                chunks.append('~s "{0}"\n'.format(name))
+                chunks.extend(self._state_chunks(i))
+        for (name, transp) in sorted(self.transp_macros.items()):
+            chunks.append('~t "{0}"\n'.format(name))
+            chunks.extend(self._transp_chunks(transp))
+        for hmm in self.hmms:
+            chunks.append('~h "{0}"\n<BEGINHMM>\n'.format(hmm.name))
+            chunks.append('<NUMSTATES> {0}\n'.format(len(hmm)))
+            for (j, i) in enumerate(hmm.states, 2):
+                chunks.append('<STATE> {0}\n'.format(j))
+                if self.state_names[i]:
+                    chunks.append('~s "{0}"\n'.format(self.state_names[i]))
+                else:
+                    chunks.extend(self._state_chunks(i))
+            if hmm.transp_name:
+                chunks.append('~t "{0}"\n'.format(hmm.transp_name))
+            else:
+                chunks.extend(self._transp_chunks(hmm.transp))
+            chunks.append('<ENDHMM>\n')
+        self._write(f, chunks)
+
+
+def read_models(*paths):
+    """
+    Reads the model files at paths (e.g., "macros" and then "hmmdefs")
+    into a single HMMSet
+    """
+    models = HMMSet()
+    for path in paths:
+        models.read(path)
+    return models
+
+
+if __name__ == '__main__':
+    out_dir = None
+    try:
+        (opts, args) = getopt(argv[1:], 'o:')
+        for (opt, val) in opts:
+            if opt == '-o':
+                out_dir = val
+        if not args:
+            raise GetoptError('No model files provided')
+    except GetoptError as err:
+        print >> stderr, 'USAGE: {0} [-o out_dir/] model_file [...]'.format(
+                                                                     argv[0])
+        exit(str(err))
+    try:
+        models = read_models(*args)
+    except (EnvironmentError, ValueError) as err:
+        exit(str(err))
+    print '{0} HMMs, {1} states ({2} shared), vector size {3}'.format(
+          len(models), len(models.state_names),
+          sum(1 for name in models.state_names if name), models.vecsize)
+    for hmm in models:
+        print '{0}\t{1}'.format(hmm.name, ' '.join(
+              models.state_names[i] or str(i) for i in hmm.states))
+    if out_dir:
+        models.write_macros(os.path.join(out_dir, 'macros'))
+        models.write_hmmdefs(os.path.join(out_dir, 'hmmdefs'))
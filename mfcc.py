@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# mfcc.py: HTK-compatible MFCC_D_A_0 features, computed with NumPy
+#
+# This computes the features HCopy computes with align.py's configuration
+# (MFCC_CFG): 25 ms Hamming windows every 10 ms, pre-emphasis of 0.97 per
+# window, the magnitude spectrum pooled by 20 triangular mel filters, 12
+# cepstral coefficients (liftered with L = 22) and C0, and deltas and
+# accelerations of all of them (windows of 2 frames), in HTK's order:
+# C1-C12, C0, then the deltas and accelerations in the same order. The
+# arithmetic follows HTK's HSigP.c, and agrees with a line-by-line
+# transcription of it, but has not yet been compared with HCopy's output;
+# bench/mfcc_hcopy.py does that, where HTK is installed.
+#
+# USAGE: python mfcc.py [-j 4] in.wav out.mfc [in.wav out.mfc ...]
+
+import wave
+import struct
+
+from sys import argv, stderr, exit
+from getopt import getopt, GetoptError
+from multiprocessing import Pool
+
+import numpy as np
+
+# HTK parameter kind: MFCC (6) with _D (0x100), _A (0x200), and _0 (0x2000)
+MFCC_D_A_0 = 6 | 0x100 | 0x200 | 0x2000
+HTK_HEADER = struct.Struct('>iihh')
+
+
+def mel(hz):
+    return 1127. * np.log(1. + np.asarray(hz) / 700.)
+
+
+class MFCC(object):
+    """
+    Computes MFCC_D_A_0 features for audio sampled at sr Hz. The window,
+    the filterbank, and the DCT are computed once, here, so an MFCC should
+    be reused for all audio with the same samplerate.
+
+    >>> features = MFCC(8000)(np.zeros(8000))  # a second of silence
+    >>> features.shape
+    (98, 39)
+    >>> features[0, 12]  # C0 of the floor of the filterbank, log(1) = 0
+    0.0
+    """
+
+    def __init__(self, sr, window=.025, shift=.01, preemph=.97,
+                 n_chans=20, n_ceps=12, lifter=22, delta_window=2):
+        self.sr = sr
+        # HTK works in 100 ns units, and truncates
+        period = 1e7 / sr
+        self.window = int(window * 1e7 / period)
+        self.shift = int(shift * 1e7 / period)
+        self.preemph = preemph
+        self.delta_window = delta_window
+        n = np.arange(self.window)
+        self.hamming = .54 - .46 * np.cos(2. * np.pi * n / (self.window - 1))
+        self.n_fft = 2
+        while self.n_fft < self.window:
+            self.n_fft *= 2
+        ## mel filterbank (HSigP.c: InitFBank), over FFT bins 1 to N / 2 - 1
+        # (DC and the Nyquist frequency are skipped)
+        bins = np.arange(1, self.n_fft // 2)
+        bin_mels = mel(bins * float(sr) / self.n_fft)
+        top = mel(self.n_fft // 2 * float(sr) / self.n_fft)
+        # centers of the filters, plus the edges 0 and top
+        centers = np.arange(n_chans + 2) * top / (n_chans + 1)
+        # each bin contributes to the filter whose center is the first one
+        # above it (lo + 1), and to the one before (lo)
+        lo = np.searchsorted(centers[1:-1], bin_mels, side='left')
+        weight = (centers[lo + 1] - bin_mels) / \
+                 (centers[lo + 1] - centers[lo])
+        self.filterbank = np.zeros((len(bins), n_chans))
+        rows = np.arange(len(bins))
+        below = lo > 0
+        self.filterbank[rows[below], lo[below] - 1] = weight[below]
+        above = lo < n_chans
+        self.filterbank[rows[above], lo[above]] = 1. - weight[above]
+        ## DCT (HSigP.c: FBank2MFCC, FBank2C0), C1-C12 then C0
+        chans = np.arange(1, n_chans + 1) - .5
+        ceps = np.arange(1, n_ceps + 1)
+        dct = np.cos(np.pi / n_chans * np.outer(chans, ceps))
+        self.dct = np.sqrt(2. / n_chans) * np.hstack((dct,
+                                                      np.ones((n_chans, 1))))
+        # liftering (HSigP.c: WeightCepstrum), which skips C0
+        self.dct[:, :n_ceps] *= 1. + lifter / 2. * np.sin(np.pi * ceps /
+                                                          lifter)
+
+    def frames(self, samples):
+        """
+        Returns the pre-emphasized, windowed frames of samples, one row per
+        frame, as HTK counts them (only whole windows)
+        """
+        samples = np.asarray(samples, dtype=float)
+        n_frames = max(0, (len(samples) - self.window) // self.shift + 1)
+        frames = np.lib.stride_tricks.as_strided(samples,
+                        shape=(n_frames, self.window),
+                        strides=(samples.strides[0] * self.shift,
+                                 samples.strides[0]))
+        # pre-emphasis is applied to each frame (HSigP.c: PreEmphasise)
+        emphasized = np.empty_like(frames)
+        emphasized[:, 1:] = frames[:, 1:] - self.preemph * frames[:, :-1]
+        emphasized[:, 0] = frames[:, 0] * (1. - self.preemph)
+        return emphasized * self.hamming
+
+    def static(self, samples):
+        """
+        Returns the static coefficients (C1-C12 and C0) of samples
+        """
+        spectrum = np.abs(np.fft.rfft(self.frames(samples), self.n_fft))
+        fbank = np.dot(spectrum[:, 1:self.n_fft // 2], self.filterbank)
+        return np.dot(np.log(np.maximum(fbank, 1.)), self.dct)
+
+    def __call__(self, samples):
+        """
+        Returns the MFCC_D_A_0 features of samples, one row per frame
+        """
+        static = self.static(samples)
+        deltas = regress(static, self.delta_window)
+        accs = regress(deltas, self.delta_window)
+        return np.hstack((static, deltas, accs)).astype(np.float32)
+
+
+def regress(features, width):
+    """
+    Computes the regression (delta) coefficients of features over windows
+    of width frames to each side, replicating the first and last frames at
+    the edges, as HTK does
+    """
+    if not len(features):
+        return features
+    padded = np.concatenate(([features[0]] * width, features,
+                             [features[-1]] * width))
+    n = len(features)
+    deltas = np.zeros_like(features)
+    for theta in xrange(1, width + 1):
+        deltas += theta * (padded[width + theta:width + theta + n] -
+                           padded[width - theta:width - theta + n])
+    return deltas / (2. * sum(theta * theta for theta in
+                              xrange(1, width + 1)))
+
+
+def read_wave(path):
+    """
+    Returns the samples (as floats, on the scale of 16-bit integers) and
+    the samplerate of the mono, 16-bit .wav file at path
+    """
+    source = wave.open(path, 'r')
+    try:
+        if source.getsampwidth() != 2 or source.getnchannels() != 1:
+            raise ValueError('{0} is not 16-bit mono audio'.format(path))
+        data = source.readframes(source.getnframes())
+        return (np.frombuffer(data, dtype='<i2').astype(float),
+                source.getframerate())
+    finally:
+        source.close()
+
+
+def write_htk(path, features, period=100000, kind=MFCC_D_A_0):
+    """
+    Writes features (one row per frame) to an HTK parameter file at path;
+    period is the frame shift, in 100 ns units
+    """
+    features = np.asarray(features, dtype='>f4')
+    with open(path, 'wb') as sink:
+        sink.write(HTK_HEADER.pack(len(features), period,
+                                   4 * features.shape[1], kind))
+        sink.write(features.tostring())
+
+
+def read_htk(path):
+    """
+    Returns the features (one row per frame), period, and parameter kind
+    of the HTK parameter file at path
+    """
+    with open(path, 'rb') as source:
+        (n_frames, period, size, kind) = HTK_HEADER.unpack(
+                                         source.read(HTK_HEADER.size))
+        features = np.fromstring(source.read(n_frames * size), dtype='>f4')
+    return (features.reshape(n_frames, size // 4).astype(np.float32),
+            period, kind)
+
+
+_front_ends = {}  # MFCCs by samplerate, for the current process
+
+
+def features(path):
+    """
+    Returns the MFCC_D_A_0 features of the .wav file at path
+    """
+    (samples, sr) = read_wave(path)
+    if sr not in _front_ends:
+        _front_ends[sr] = MFCC(sr)
+    return _front_ends[sr](samples)
+
+
+def _copy(pair):
+    (wav, mfc) = pair
+    write_htk(mfc, features(wav))
+
+
+def copy(pairs, n_jobs=1):
+    """
+    Computes features for each (wav, mfc) pair in pairs, writing them to
+    mfc, like HCopy does with a script file. If n_jobs is more than 1, a
+    pool of n_jobs processes is used.
+    """
+    if n_jobs < 2:
+        for pair in pairs:
+            _copy(pair)
+        return
+    pool = Pool(n_jobs)
+    try:
+        for _ in pool.imap_unordered(_copy, pairs, chunksize=16):
+            pass
+    finally:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    n_jobs = 1
+    try:
+        (opts, args) = getopt(argv[1:], 'j:')
+        for (opt, val) in opts:
+            if opt == '-j':
+                n_jobs = int(val)
+        if not args or len(args) % 2:
+            raise GetoptError('Expected pairs of .wav and .mfc files')
+    except (ValueError, GetoptError) as err:
+        print >> stderr, 'USAGE: {0} [-j 4] in.wav out.mfc [...]'.format(
+                                                                     argv[0])
+        exit(str(err))
+    copy(zip(args[::2], args[1::2]), n_jobs)
@@ -30,10 +30,125 @@
 
 import re
 import codecs
+import struct
 import os.path
 
 from sys import stderr
-from bisect import bisect_left
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from multiprocessing import Pool
+
+try: # only needed to look up many times at once in an IntervalIndex
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# a token in a Praat text file: a string (in which "" stands for "), a 
+# number, or a <flag>. Anything else (labels, [indices], and ! comments) 
+# matches with all three groups empty; the first alternative lets the 
+# regex engine skip over labels quickly
+_TOKEN = re.compile(r'[^"\d<\[!+\-.]+|'
+                    r'("[^"]*(?:""[^"]*)*")|'
+                    r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|'
+                    r'<(\w+)>|\[[^\]\n]*\]|!.*')
+
+
+# the TextGrid formats Praat reads and writes: see TextGrid.write
+FORMATS = ('long', 'short', 'binary')
+
+# the first bytes of a Praat binary file
+_BINARY_HEADER = 'ooBinaryFile'
+
+
+def _unquote(string):
+    """
+    Removes the quotes around a Praat string token, and unescapes any 
+    quotes inside it
+    """
+    return string[1:-1].replace('""', '"')
+
+
+def _quote(string):
+    """
+    The inverse of _unquote
+    """
+    return u'"' + unicode(string).replace(u'"', u'""') + u'"'
+
+
+def _unpackString(data, i, width):
+    """
+    Read a string from Praat binary data at offset i, returning it and 
+    the offset after it. Its length is given in the first width (1 or 2) 
+    bytes; if these are all ones, the string is UTF-16 (with its length 
+    in the next width bytes) rather than ASCII.
+    """
+    code = '>B' if width == 1 else '>H'
+    (n,) = struct.unpack_from(code, data, i)
+    i += width
+    if n == (1 << 8 * width) - 1:
+        (n,) = struct.unpack_from(code, data, i)
+        i += width
+        return (data[i:i + 2 * n].decode('UTF-16-BE'), i + 2 * n)
+    return (data[i:i + n].decode('ASCII'), i + n)
+
+
+def _packString(string, width):
+    """
+    The inverse of _unpackString
+    """
+    code = '>B' if width == 1 else '>H'
+    string = unicode(string)
+    try:
+        data = string.encode('ASCII')
+        return struct.pack(code, len(data)) + data
+    except UnicodeError:
+        data = string.encode('UTF-16-BE')
+        return struct.pack(code + code[1:], (1 << 8 * width) - 1, 
+                           len(data) // 2) + data
+
+
+def _binaryTokens(data):
+    """
+    Generate the contents of a Praat binary TextGrid in the same order, 
+    and in the same form, as _TOKEN finds them in the text formats
+    """
+    (junk, i) = _unpackString(data, len(_BINARY_HEADER), 1)
+    yield _quote(_BINARY_HEADER)
+    yield _quote(junk)
+    (xmin, xmax, exists) = struct.unpack_from('>2d?', data, i)
+    i += 17
+    yield xmin
+    yield xmax
+    yield 'exists' if exists else 'absent'
+    if not exists:
+        return
+    (n,) = struct.unpack_from('>i', data, i)
+    i += 4
+    yield n
+    for j in xrange(n):
+        (klass, i) = _unpackString(data, i, 1)
+        yield _quote(klass)
+        (name, i) = _unpackString(data, i, 2)
+        yield _quote(name)
+        (xmin, xmax, size) = struct.unpack_from('>2di', data, i)
+        i += 20
+        yield xmin
+        yield xmax
+        yield size
+        for k in xrange(size):
+            if klass == 'IntervalTier':
+                (xmin, xmax) = struct.unpack_from('>2d', data, i)
+                i += 16
+                yield xmin
+                yield xmax
+            else: # TextTier
+                (time,) = struct.unpack_from('>d', data, i)
+                i += 8
+                yield time
+            (mark, i) = _unpackString(data, i, 2)
+            yield _quote(mark)
 
 
 def readFile(f):
@@ -44,6 +159,78 @@ def readFile(f):
     return codecs.open(f, 'r', encoding='UTF-8')
 
 
+
+# templates for rendering the text formats (see TextGrid.write) in one 
+# pass; the short ones skip over the index of each item with "%.0s"
+_TEMPLATES = {'long': (u'File type = "ooTextFile"\n'
+                       u'Object class = "TextGrid"\n\n'
+                       u'xmin = %s\nxmax = %s\ntiers? <exists>\n'
+                       u'size = %d\nitem []:\n',
+                       u'\titem [%d]:\n\t\tclass = "IntervalTier"\n'
+                       u'\t\tname = %s\n\t\txmin = %s\n\t\txmax = %s\n'
+                       u'\t\tintervals: size = %d\n',
+                       u'\t\t\tintervals [%d]:\n\t\t\t\txmin = %s\n'
+                       u'\t\t\t\txmax = %s\n\t\t\t\ttext = %s\n',
+                       u'\titem [%d]:\n\t\tclass = "TextTier"\n'
+                       u'\t\tname = %s\n\t\txmin = %s\n\t\txmax = %s\n'
+                       u'\t\tpoints: size = %d\n',
+                       u'\t\t\tpoints [%d]:\n\t\t\t\ttime = %s\n'
+                       u'\t\t\t\tmark = %s\n'),
+              'short': (u'File type = "ooTextFile"\n'
+                        u'Object class = "TextGrid"\n\n'
+                        u'%s\n%s\n<exists>\n%d\n',
+                        u'%.0s"IntervalTier"\n%s\n%s\n%s\n%d\n',
+                        u'%.0s%s\n%s\n%s\n',
+                        u'%.0s"TextTier"\n%s\n%s\n%s\n%d\n',
+                        u'%.0s%s\n%s\n')}
+_INTERVAL_TIER = (u'File type = "ooTextFile"\n'
+                  u'Object class = "IntervalTier"\n\n'
+                  u'xmin = %s\nxmax = %s\nintervals: size = %d\n',
+                  u'intervals [%d]\n\txmin = %s\n\txmax = %s\n'
+                  u'\ttext = %s\n')
+_POINT_TIER = (u'File type = "ooTextFile"\n'
+               u'Object class = "TextTier"\n\n'
+               u'xmin = %s\nxmax = %s\npoints: size = %d\n',
+               u'points [%d]:\n\ttime = %s\n\tmark = %s\n')
+
+
+def _renderIntervals(tier, null, template):
+    """
+    Render the intervals of tier with template, which is given the index, 
+    times, and quoted mark of each, filling in the gaps between them as 
+    IntervalTier._fillInTheGaps does, and return the resulting strings
+    """
+    lines = []
+    null = _quote(null)
+    prev_t = tier.minTime
+    for interval in tier.intervals:
+        if prev_t < interval.minTime:
+            lines.append(template % (len(lines) + 1, prev_t, 
+                                     interval.minTime, null))
+        lines.append(template % (len(lines) + 1, interval.minTime, 
+                                 interval.maxTime, _quote(interval.mark)))
+        prev_t = interval.maxTime
+    # last interval
+    if prev_t < tier.maxTime: # also false if maxTime isn't defined
+        lines.append(template % (len(lines) + 1, prev_t, tier.maxTime, 
+                                 null))
+    return lines
+
+
+def _writeText(f, text):
+    """
+    Write the unicode string text in a single call to f, which is either 
+    a file object or a string naming a path to write it to in UTF-8, and 
+    then close it
+    """
+    if hasattr(f, 'write'):
+        f.write(text)
+        f.close()
+    else:
+        with open(f, 'wb') as sink:
+            sink.write(text.encode('UTF-8'))
+
+
 class Point(object):
     """ 
     Represents a point in time with an associated textual mark, as stored 
@@ -77,6 +264,8 @@ class Point(object):
     True
     """
 
+    __slots__ = ('time', 'mark') # no per-instance __dict__
+
     def __init__(self, time, mark):
         self.time = time
         self.mark = mark
@@ -85,6 +274,12 @@ class Point(object):
         return 'Point({0}, {1})'.format(self.time, 
                                         self.mark if self.mark else None)
 
+    def __getstate__(self): # needed to pickle with __slots__
+        return (self.time, self.mark)
+
+    def __setstate__(self, state):
+        (self.time, self.mark) = state
+
     def __cmp__(self, other):
         """
         In addition to the obvious semantics, Point/Interval comparison is
@@ -130,6 +325,8 @@ class Interval(object):
     True
     """
 
+    __slots__ = ('minTime', 'maxTime', 'mark') # no per-instance __dict__
+
     def __init__(self, minTime, maxTime, mark):
         if minTime > maxTime: # not an actual interval
             raise ValueError(minTime, maxTime)
@@ -141,6 +338,12 @@ class Interval(object):
         return 'Interval({0}, {1}, {2})'.format(self.minTime, self.maxTime,
                                          self.mark if self.mark else None)
 
+    def __getstate__(self): # needed to pickle with __slots__
+        return (self.minTime, self.maxTime, self.mark)
+
+    def __setstate__(self, state):
+        (self.minTime, self.maxTime, self.mark) = state
+
     def duration(self):
         """ 
         Returns the duration of the interval in seconds.
@@ -299,18 +502,11 @@ class PointTier(object):
         file. f may be a file object to write to, or a string naming a 
         path for writing
         """
-        sink = f if hasattr(f, 'write') else codecs.open(f, 'w', 'UTF-8')
-        print >> sink, 'File type = "ooTextFile"'
-        print >> sink, 'Object class = "TextTier"'
-        print >> sink
-        print >> sink, 'xmin = {0}'.format(min(self))
-        print >> sink, 'xmax = {0}'.format(max(self))
-        print >> sink, 'points: size = {0}'.format(len(self))
-        for (i, point) in enumerate(self.points, 1):
-            print >> sink, 'points [{0}]:'.format(i)
-            print >> sink, '\ttime = {0}'.format(point.time)
-            print >> sink, u'\tmark = {0}'.format(point.mark)
-        sink.close()
+        (header, template) = _POINT_TIER
+        lines = [header % (self.minTime, self.bounds()[1], len(self))]
+        lines.extend([template % (i, point.time, _quote(point.mark)) for
+                      (i, point) in enumerate(self.points, 1)])
+        _writeText(f, u''.join(lines))
 
     def bounds(self):
         return (self.minTime, self.maxTime or self.points[-1].time)
@@ -408,6 +604,72 @@ class IntervalTier(object):
             raise ValueError(self.intervals[i])
         self.intervals.insert(i, interval)
 
+    def addIntervals(self, intervals):
+        """
+        Add many Intervals at once, raising ValueError (and leaving the 
+        tier as it was) in the same cases as addInterval. Rather than 
+        search and insert for each, they are sorted together with those 
+        already in the tier and then checked in one pass, so that this 
+        takes O(n log n) time.
+        """
+        output = sorted(self.intervals + list(intervals), 
+                        key=attrgetter('minTime'))
+        if not output:
+            return
+        if output[0].minTime < self.minTime: # too early
+            raise ValueError(self.minTime)
+        for (a, b) in zip(output, output[1:]):
+            if b.minTime < a.maxTime:
+                raise ValueError(a, b)
+        if self.maxTime and output[-1].maxTime > self.maxTime: # too late
+            raise ValueError(self.maxTime)
+        self.intervals = output
+
+    def extendSorted(self, intervals):
+        """
+        Add Intervals which are already in order, and come after those 
+        already in the tier. Rather than search and insert for each, as 
+        addInterval does, this checks their order in a single pass, and 
+        raises ValueError (leaving the tier as it was) if they are out of 
+        order, overlap, or fall outside the bounds of the tier.
+        """
+        intervals = list(intervals)
+        if not intervals:
+            return
+        if intervals[0].minTime < self.minTime: # too early
+            raise ValueError(self.minTime)
+        prev = self.intervals[-1] if self.intervals else None
+        for interval in intervals:
+            if prev is not None and interval.minTime < prev.maxTime:
+                raise ValueError(prev, interval)
+            prev = interval
+        if self.maxTime and intervals[-1].maxTime > self.maxTime: # too late
+            raise ValueError(self.maxTime)
+        self.intervals.extend(intervals)
+
+    @classmethod
+    def fromArrays(cls, name, minTimes, maxTimes, marks, minTime=0., 
+                   maxTime=None):
+        """
+        Construct an IntervalTier from sequences of the start times, end 
+        times, and marks of its intervals, which must be in order (see 
+        extendSorted)
+
+        >>> IntervalTier.fromArrays('foo', [0.0, 2.0], [1.0, 2.5], 
+        ...                         ['bar', 'baz'])
+        IntervalTier(foo, [Interval(0.0, 1.0, bar), Interval(2.0, 2.5, baz)])
+        >>> IntervalTier.fromArrays('foo', [0.0, 0.5], [1.0, 2.5], 
+        ...                         ['bar', 'baz'])
+        Traceback (most recent call last):
+            ...
+        ValueError: (Interval(0.0, 1.0, bar), Interval(0.5, 2.5, baz))
+        """
+        if not len(minTimes) == len(maxTimes) == len(marks):
+            raise ValueError('sequences differ in length')
+        tier = cls(name, minTime, maxTime)
+        tier.extendSorted(map(Interval, minTimes, maxTimes, marks))
+        return tier
+
     def remove(self, minTime, maxTime, mark):
         self.removeInterval(Interval(minTime, maxTime, mark))
 
@@ -433,7 +695,7 @@ class IntervalTier(object):
         can be a numeric type, or a Point object.
         """
         i = self.indexContaining(time)
-        if i: 
+        if i is not None:
             return self.intervals[i]
 
     def read(self, f):
@@ -477,27 +739,120 @@ class IntervalTier(object):
         may be a file object to write to, or a string naming a path for 
         writing
         """
-        sink = f if hasattr(f, 'write') else open(f, 'w')
-        print >> sink, 'File type = "ooTextFile"'
-        print >> sink, 'Object class = "IntervalTier"\n'
-        print >> sink, 'xmin = {0}'.format(self.minTime)
-        print >> sink, 'xmax = {0}'.format(self.maxTime if self.maxTime \
-                                          else self.intervals[-1].maxTime)
-        # compute the number of intervals and make the empty ones
-        output = self._fillInTheGaps(null)
-        # write it all out
-        print >> sink, 'intervals: size = {0}'.format(len(output))
-        for (i, interval) in enumerate(output, 1):
-            print >> sink, 'intervals [{0}]'.format(i)
-            print >> sink, '\txmin = {0}'.format(interval.minTime)
-            print >> sink, '\txmax = {0}'.format(interval.maxTime)
-            print >> sink, '\ttext = "{0}"'.format(interval.mark)
-        sink.close()
+        (header, template) = _INTERVAL_TIER
+        lines = _renderIntervals(self, null, template)
+        _writeText(f, header % (self.minTime, self.bounds()[1], len(lines))
+                      + u''.join(lines))
 
     def bounds(self):
         return self.minTime, self.maxTime or self.intervals[-1].maxTime
 
 
+class IntervalIndex(object):
+    """
+    An index for answering many time queries against an IntervalTier, 
+    which stores the start and end times of its intervals in arrays and 
+    searches those, rather than comparing Interval objects. The index 
+    does not see changes made to the tier after it is built.
+
+    >>> foo = IntervalTier('foo')
+    >>> foo.addIntervals([Interval(2.0, 2.5, 'baz'), 
+    ...                   Interval(0.0, 1.0, 'bar'), 
+    ...                   Interval(2.5, 3.0, 'qux')])
+    >>> index = IntervalIndex(foo)
+    >>> index.intervalContaining(2.25)
+    Interval(2.0, 2.5, baz)
+    >>> index.indexContaining(1.5) # in a gap
+    >>> index.indicesContaining([0.5, 2.5, 1.5, 3.5, Point(2.75, 'x')])
+    [0, 2, None, None, 2]
+    >>> index.intervalsOverlapping(0.5, 2.25)
+    [Interval(0.0, 1.0, bar), Interval(2.0, 2.5, baz)]
+    >>> index.intervalsOverlapping(1.0, 2.0)
+    []
+    """
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.minTimes = array('d', [i.minTime for i in tier.intervals])
+        self.maxTimes = array('d', [i.maxTime for i in tier.intervals])
+
+    def __len__(self):
+        return len(self.minTimes)
+
+    def indexContaining(self, time):
+        """
+        Returns the index of the interval containing the given time point 
+        (a numeric type, or a Point object), or None; at a boundary 
+        between two intervals, it is the later one
+        """
+        time = getattr(time, 'time', time)
+        i = bisect_right(self.minTimes, time) - 1
+        if i >= 0 and time <= self.maxTimes[i]:
+            return i
+
+    def intervalContaining(self, time):
+        """
+        Returns the interval containing the given time point, or None
+        """
+        i = self.indexContaining(time)
+        if i is not None:
+            return self.tier.intervals[i]
+
+    def indicesContaining(self, times):
+        """
+        Returns a list of the results of indexContaining for each of the 
+        given time points, in one call; this is the fastest way to look 
+        up many times (e.g., pitch samples). With NumPy, they are all 
+        searched for at once, and times may also be an array.
+        """
+        (minTimes, maxTimes) = (self.minTimes, self.maxTimes)
+        if np is not None:
+            if isinstance(times, np.ndarray):
+                times = times.astype(float, copy=False)
+            else:
+                times = np.fromiter((getattr(time, 'time', time) for time 
+                                     in times), dtype=float)
+            minTimes = np.frombuffer(minTimes, dtype=float)
+            maxTimes = np.frombuffer(maxTimes, dtype=float)
+            indices = np.searchsorted(minTimes, times, side='right') - 1
+            found = indices >= 0
+            found[found] &= times[found] <= maxTimes[indices[found]]
+            return [i if ok else None for (i, ok) in 
+                    zip(indices.tolist(), found.tolist())]
+        output = []
+        for time in times:
+            time = getattr(time, 'time', time)
+            i = bisect_right(minTimes, time) - 1
+            output.append(i if i >= 0 and time <= maxTimes[i] else None)
+        return output
+
+    def intervalsContaining(self, times):
+        """
+        Returns a list of the results of intervalContaining for each of 
+        the given time points
+        """
+        intervals = self.tier.intervals
+        return [None if i is None else intervals[i] for i in 
+                self.indicesContaining(times)]
+
+    def indicesOverlapping(self, minTime, maxTime):
+        """
+        Returns the range of the indices of the intervals which overlap 
+        the time span from minTime to maxTime (see Interval.overlaps)
+        """
+        # intervals in a tier don't overlap, so maxTimes is sorted too
+        return xrange(bisect_right(self.maxTimes, minTime), 
+                      bisect_left(self.minTimes, maxTime))
+
+    def intervalsOverlapping(self, minTime, maxTime):
+        """
+        Returns a list of the intervals which overlap the time span from 
+        minTime to maxTime
+        """
+        span = self.indicesOverlapping(minTime, maxTime)
+        return self.tier.intervals[span[0]:span[-1] + 1] if span else []
+
+
 class IntervalTierFromFile(IntervalTier):
     """
     The same as a IntervalTier, but initialized from a text file
@@ -620,117 +975,153 @@ class TextGrid(object):
         """
         return (self.tiers.pop(i) if i else self.tiers.pop())
 
-    @staticmethod
-    def _getMark(text):
-        """
-        Get the "mark" text on a line. Since Praat doesn't prevent you 
-        from using your platform's newline character in "text" fields, we
-        read until we find a match. Regression tests are in `RWtests.py`.
-        """
-        m = None
-        my_line = ''
-        while True:
-            my_line += text.readline()
-            m = re.search(r'(\S+)\s(=)\s(".*")', my_line, 
-                          re.DOTALL)
-            if m != None:
-                break
-        return m.groups()[2][1:-1]
-
     def read(self, f):
         """
         Read the tiers contained in the Praat-formated TextGrid file 
-        indicated by string f
+        indicated by string f. Text files are tokenized in one pass (see 
+        _TOKEN), so text fields may contain newlines, and the short text 
+        format is read as well as the long one; Praat binary files are 
+        read too.
         """
-        source = readFile(f)
-        source.readline() # header junk
-        source.readline() # header junk
-        source.readline() # header junk
-        self.minTime = round(float(source.readline().split()[2]), 5)
-        self.maxTime = round(float(source.readline().split()[2]), 5)
-        source.readline() # more header junk
-        m = int(source.readline().rstrip().split()[2]) # will be self.n
-        source.readline()
-        for i in xrange(m): # loop over grids
-            source.readline()
-            if source.readline().rstrip().split()[2] == '"IntervalTier"': 
-                inam = source.readline().rstrip().split(' = ')[1].strip('"')
-                imin = round(float(source.readline().rstrip().split()[2]), 5)
-                imax = round(float(source.readline().rstrip().split()[2]), 5)
+        with open(f, 'rb') as source:
+            data = source.read()
+        if data.startswith(_BINARY_HEADER):
+            tokens = _binaryTokens(data)
+        else:
+            # Praat saves text files with non-ASCII marks as UTF-16
+            if data.startswith((codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE)):
+                data = data.decode('UTF-16')
+            else:
+                data = data.decode('UTF-8')
+            tokens = iter([string or number or flag for 
+                           (string, number, flag) in _TOKEN.findall(data)
+                           if string or number or flag])
+        next(tokens) # "ooTextFile" or "ooBinaryFile"
+        next(tokens) # "TextGrid"
+        self.minTime = round(float(next(tokens)), 5)
+        self.maxTime = round(float(next(tokens)), 5)
+        if next(tokens) != 'exists':
+            return
+        for i in xrange(int(next(tokens))): # loop over grids
+            if _unquote(next(tokens)) == 'IntervalTier':
+                inam = _unquote(next(tokens))
+                imin = round(float(next(tokens)), 5)
+                imax = round(float(next(tokens)), 5)
                 itie = IntervalTier(inam)
-                for j in xrange(int(source.readline().rstrip().split()[3])):
-                    source.readline().rstrip().split() # header junk
-                    jmin = round(float(source.readline().rstrip().split()[2]), 5)
-                    jmax = round(float(source.readline().rstrip().split()[2]), 5)
-                    jmrk = self._getMark(source)
+                intervals = []
+                for j in xrange(int(next(tokens))):
+                    jmin = round(float(next(tokens)), 5)
+                    jmax = round(float(next(tokens)), 5)
+                    jmrk = _unquote(next(tokens))
                     if jmin < jmax: # non-null
-                        itie.addInterval(Interval(jmin, jmax, jmrk))
+                        intervals.append(Interval(jmin, jmax, jmrk))
+                try: # Praat writes them in order
+                    itie.extendSorted(intervals)
+                except ValueError:
+                    itie.addIntervals(intervals)
                 self.append(itie)
             else: # pointTier
-                inam = source.readline().rstrip().split(' = ')[1].strip('"')
-                imin = round(float(source.readline().rstrip().split()[2]), 5)
-                imax = round(float(source.readline().rstrip().split()[2]), 5)
+                inam = _unquote(next(tokens))
+                imin = round(float(next(tokens)), 5)
+                imax = round(float(next(tokens)), 5)
                 itie = PointTier(inam)
-                n = int(source.readline().rstrip().split()[3])
-                for j in xrange(n):
-                    source.readline().rstrip() # header junk
-                    jtim = round(float(source.readline().rstrip().split()[2]),
-                                                                           5)
-                    jmrk = source.readline().rstrip().split()[2][1:-1]
+                for j in xrange(int(next(tokens))):
+                    jtim = round(float(next(tokens)), 5)
+                    jmrk = _unquote(next(tokens))
                     itie.addPoint(Point(jtim, jmrk))
                 self.append(itie)
-        source.close()
 
-    def write(self, f, null=''):
+    def write(self, f, null='', format='long'):
         """
         Write the current state into a Praat-format TextGrid file. f may 
         be a file object to write to, or a string naming a path to open 
-        for writing.
+        for writing. format is one of FORMATS: Praat's "long" text format 
+        (the default), its "short" text format, which is the same without 
+        the labels, or its "binary" format, for which a file object must 
+        be opened in binary mode. Whatever the format, read gives back the 
+        same grid, which is written out again byte for byte:
+
+        >>> import os, tempfile
+        >>> grid = TextGrid('foo')
+        >>> phones = IntervalTier('phones')
+        >>> phones.add(0.0, 0.5, 'AA1')
+        >>> phones.add(0.75, 1.0, u'say "\\xe9"')
+        >>> grid.append(phones)
+        >>> events = PointTier('events')
+        >>> events.add(0.6, 'click')
+        >>> grid.append(events)
+        >>> (handle, path) = tempfile.mkstemp()
+        >>> os.close(handle)
+        >>> for format in FORMATS:
+        ...     grid.write(path, format=format)
+        ...     data = open(path, 'rb').read()
+        ...     copy = TextGrid()
+        ...     copy.read(path)
+        ...     copy.write(path, format=format)
+        ...     print format, open(path, 'rb').read() == data, \\
+        ...           [i.mark for i in copy.getFirst('phones')]
+        long True [u'AA1', u'', u'say "\\xe9"']
+        short True [u'AA1', u'', u'say "\\xe9"']
+        binary True [u'AA1', u'', u'say "\\xe9"']
+        >>> os.remove(path)
         """
-        sink = f if hasattr(f, 'write') else codecs.open(f, 'w', 'UTF-8')
-        print >> sink, 'File type = "ooTextFile"'
-        print >> sink, 'Object class = "TextGrid"\n'
-        print >> sink, 'xmin = {0}'.format(self.minTime)
+        if format not in FORMATS:
+            raise ValueError(format)
         # compute max time
         maxT = self.maxTime
         if not maxT:
-            maxT = max([t.maxTime if t.maxTime else t[-1].maxTime \
-                                               for t in self.tiers])
-        print >> sink, 'xmax = {0}'.format(maxT)
-        print >> sink, 'tiers? <exists>'
-        print >> sink, 'size = {0}'.format(len(self))
-        print >> sink, 'item []:'
+            maxT = max([t.bounds()[1] for t in self.tiers])
+        if format == 'binary':
+            sink = f if hasattr(f, 'write') else open(f, 'wb')
+            self._writeBinary(sink, maxT, null)
+            sink.close()
+        else:
+            _writeText(f, self._render(maxT, null, _TEMPLATES[format]))
+
+    def _render(self, maxT, null, templates):
+        """
+        Render the current state in a text format, given the templates for 
+        the grid, an IntervalTier, an interval, a PointTier, and a point
+        """
+        (grid, intervalTier, interval, pointTier, point) = templates
+        lines = [grid % (self.minTime, maxT, len(self))]
         for (i, tier) in enumerate(self.tiers, 1):
-            print >> sink, '\titem [{0}]:'.format(i)
-            if tier.__class__ == IntervalTier: 
-                print >> sink, '\t\tclass = "IntervalTier"'
-                print >> sink, '\t\tname = "{0}"'.format(tier.name)
-                print >> sink, '\t\txmin = {0}'.format(tier.minTime)
-                print >> sink, '\t\txmax = {0}'.format(maxT)
-                # compute the number of intervals and make the empty ones
+            if tier.__class__ == IntervalTier:
+                output = _renderIntervals(tier, null, interval)
+                lines.append(intervalTier % (i, _quote(tier.name), 
+                                             tier.minTime, maxT, 
+                                             len(output)))
+                lines.extend(output)
+            elif tier.__class__ == PointTier:
+                lines.append(pointTier % (i, _quote(tier.name), 
+                                          tier.minTime, maxT, len(tier)))
+                lines.extend([point % (k, p.time, _quote(p.mark)) for
+                              (k, p) in enumerate(tier.points, 1)])
+        return u''.join(lines)
+
+    def _writeBinary(self, sink, maxT, null):
+        data = [_BINARY_HEADER, _packString('TextGrid', 1),
+                struct.pack('>2d?i', self.minTime, maxT, True, len(self))]
+        for tier in self.tiers:
+            if tier.__class__ == IntervalTier:
                 output = tier._fillInTheGaps(null)
-                print >> sink, '\t\tintervals: size = {0}'.format(
-                                                           len(output))
-                for (j, interval) in enumerate(output, 1):
-                    print >> sink, '\t\t\tintervals [{0}]:'.format(j)
-                    print >> sink, '\t\t\t\txmin = {0}'.format(
-                                                        interval.minTime)
-                    print >> sink, '\t\t\t\txmax = {0}'.format(
-                                                        interval.maxTime)
-                    print >> sink, u'\t\t\t\ttext = "{0}"'.format(
-                                                        interval.mark)
-            elif tier.__class__ == PointTier: # PointTier
-                print >> sink, '\t\tclass = "TextTier"'
-                print >> sink, '\t\tname = "{0}"'.format(tier.name)
-                print >> sink, '\t\txmin = {0}'.format(min(tier))
-                print >> sink, '\t\txmax = {0}'.format(max(tier))
-                print >> sink, '\t\tpoints: size = {0}'.format(len(tier))
-                for (k, point) in enumerate(tier, 1):
-                    print >> sink, '\t\t\tpoints [{0}]:'.format(k)
-                    print >> sink, '\t\t\t\ttime = {0}'.format(point.time)
-                    print >> sink, u'\t\t\t\tmark = "{0}"'.format(
-                                                           point.mark)
-        sink.close()
+                data.append(_packString('IntervalTier', 1))
+                data.append(_packString(tier.name, 2))
+                data.append(struct.pack('>2di', tier.minTime, maxT, 
+                                        len(output)))
+                for interval in output:
+                    data.append(struct.pack('>2d', interval.minTime, 
+                                                   interval.maxTime))
+                    data.append(_packString(interval.mark, 2))
+            elif tier.__class__ == PointTier:
+                data.append(_packString('TextTier', 1))
+                data.append(_packString(tier.name, 2))
+                data.append(struct.pack('>2di', tier.minTime, maxT, 
+                                        len(tier)))
+                for point in tier:
+                    data.append(struct.pack('>d', point.time))
+                    data.append(_packString(point.mark, 2))
+        sink.write(''.join(data))
 
 
 class TextGridFromFile(TextGrid):
@@ -746,6 +1137,149 @@ class TextGridFromFile(TextGrid):
         self.read(f)
 
 
+def iterMLF(f, samplerate=10e6):
+    """
+    Read in a HTK .mlf file generated with HVite -o SM, yielding one 
+    TextGrid at a time, so that only one is held in memory at once.
+    """
+    with open(f, 'r') as source: # HTK returns ostensible ASCII
+        source.readline() # header
+        for grid in parseMLF(source, samplerate):
+            yield grid
+
+
+def parseMLF(lines, samplerate=10e6):
+    """
+    The same as iterMLF, but reading the records from lines, an iterable 
+    of the lines of a .mlf file after its header (e.g., a file object).
+    """
+    lines = iter(lines)
+    samplerate = float(samplerate)
+    while True: # loop over text
+        name = re.match('\"(.*)\"', next(lines, '').rstrip())
+        if name:
+            segments = []
+            while 1: # loop over the lines in each grid
+                line = next(lines, '').rstrip().split()
+                if len(line) == 4: # word on this baby
+                    segments.append((round(float(line[0]) / samplerate, 5),
+                                     round(float(line[1]) / samplerate, 5),
+                                     line[2], decode(line[3])))
+                elif len(line) == 3: # just phone
+                    segments.append((round(float(line[0]) / samplerate, 5),
+                                     round(float(line[1]) / samplerate, 5),
+                                     line[2], None))
+                else: # it's a period
+                    break
+            yield gridFromSegments(name.groups()[0], segments)
+        else:
+            break
+
+
+def gridFromSegments(name, segments):
+    """
+    Build a TextGrid with "phones" and "words" tiers from segments, the 
+    (minTime, maxTime, phone, word) tuples of one record of an HVite -o 
+    SM alignment, in order; word is None except for the first phone of 
+    each word. A "sp" which takes up time is a "sp" in the words tier, 
+    and one which does not is left out.
+
+    >>> grid = gridFromSegments('a', [(0., .1, 'sil', u'sil'),
+    ...                               (.1, .2, 'sp', None),
+    ...                               (.2, .3, 'ah', u'a'),
+    ...                               (.3, .3, 'sp', None)])
+    >>> [interval.mark for interval in grid[1]]
+    [u'sil', u'sp', u'a']
+    """
+    grid = TextGrid(name)
+    phon = [] # HVite output is in order, so it is added in bulk
+    word = []
+    wmrk = ''
+    wsrt = 0.
+    wend = 0.
+    for (pmin, pmax, phone, mark) in segments:
+        if mark is not None: # word on this baby
+            if pmin == pmax:
+                raise ValueError('null duration interval')
+            phon.append(Interval(pmin, pmax, phone))
+            if wmrk:
+                word.append(Interval(wsrt, wend, wmrk))
+            wmrk = mark
+            wsrt = pmin
+            wend = pmax
+        else: # just phone
+            if phone == 'sp' and pmin != pmax:
+                if wmrk:
+                    word.append(Interval(wsrt, wend, wmrk))
+                wmrk = decode(phone)
+                wsrt = pmin
+                wend = pmax
+            elif pmin != pmax:
+                phon.append(Interval(pmin, pmax, phone))
+            wend = pmax
+    word.append(Interval(wsrt, wend, wmrk))
+    for (tier, intervals) in (('phones', phon), ('words', word)):
+        tier = IntervalTier(name=tier)
+        tier.extendSorted(intervals)
+        grid.append(tier)
+    return grid
+
+
+def splitMLF(f, n):
+    """
+    Return a list of up to n (start, end) byte offsets which divide the 
+    records of the .mlf file f into chunks of about equal size, each of 
+    which can be read with parseMLF
+    """
+    with open(f, 'r') as source:
+        source.readline() # header
+        offsets = [source.tell()]
+        size = os.fstat(source.fileno()).st_size
+        for i in xrange(1, n):
+            target = offsets[0] + (size - offsets[0]) * i // n
+            if target <= offsets[-1]:
+                continue
+            # skip the rest of the line the target is in, then go on to 
+            # the end of the record
+            source.seek(target - 1)
+            source.readline()
+            for line in iter(source.readline, ''):
+                if line.rstrip() == '.':
+                    break
+            if source.tell() < size:
+                offsets.append(source.tell())
+        offsets.append(size)
+    return zip(offsets, offsets[1:])
+
+
+def writeGrids(grids, prefix='', format='long'):
+    """
+    Write each of grids to a file in the directory prefix, named after 
+    the grid (e.g., "mfc/myLabFile.lab" is written to 
+    "myLabFile.TextGrid"), as MLF.write does, returning the number written
+    """
+    n = 0
+    for grid in grids:
+        (junk, tail) = os.path.split(grid.name)
+        (root, junk) = os.path.splitext(tail)
+        my_path = os.path.join(prefix, root + '.TextGrid')
+        grid.write(my_path, format=format)
+        n += 1
+    return n
+
+
+def _writeMLFChunk(args):
+    """
+    Parse the (start, end) chunk of an MLF and write its TextGrids, for 
+    MLF.write to map over in worker processes
+    """
+    (f, (start, end), samplerate, prefix, format) = args
+    with open(f, 'r') as source:
+        source.seek(start)
+        lines = source.read(end - start).splitlines()
+    return writeGrids(parseMLF(lines, samplerate), prefix, format)
+
+
 class MLF(object):
     """
     Read in a HTK .mlf file generated with HVite -o SM and turn it into a 
@@ -753,15 +1287,27 @@ class MLF(object):
     one TextGrid at a time, or the write(prefix='') class method can be 
     used to write all the resulting TextGrids into separate files.
 
-    Unlike other classes, this is always initialized from a text file.
+    Unlike other classes, this is always initialized from a text file. 
+    The file is only parsed in full when the list of TextGrids is needed
+    (e.g., for len() or indexing); iteration and write() stream through 
+    it one TextGrid at a time (see iterMLF).
     """
 
     def __init__(self, f, samplerate=10e6):
-        self.grids = []
-        self.read(f, samplerate)
+        self.f = f
+        self.samplerate = samplerate
+        self._grids = None
+
+    @property
+    def grids(self):
+        if self._grids is None:
+            self.read(self.f, self.samplerate)
+        return self._grids
 
     def __iter__(self):
-        return iter(self.grids)
+        if self._grids is None:
+            return iterMLF(self.f, self.samplerate)
+        return iter(self._grids)
 
     def __str__(self):
         return '<MLF, {0} TextGrids>'.format(len(self))
@@ -779,71 +1325,36 @@ class MLF(object):
         return self.grids[i]
 
     def read(self, f, samplerate):
-        source = open(f, 'r') # HTK returns ostensible ASCII
-        samplerate = float(samplerate)
-        source.readline() # header
-        while True: # loop over text
-            name = re.match('\"(.*)\"', source.readline().rstrip())
-            if name:
-                name = name.groups()[0]
-                grid = TextGrid(name)
-                phon = IntervalTier(name='phones')
-                word = IntervalTier(name='words')
-                wmrk = ''
-                wsrt = 0.
-                wend = 0.
-                while 1: # loop over the lines in each grid
-                    line = source.readline().rstrip().split()
-                    if len(line) == 4: # word on this baby
-                        pmin = round(float(line[0]) / samplerate, 5)
-                        pmax = round(float(line[1]) / samplerate, 5)
-                        if pmin == pmax:
-                            raise ValueError('null duration interval')
-                        phon.add(pmin, pmax, line[2])
-                        if wmrk:
-                            word.add(wsrt, wend, wmrk)
-                        wmrk = decode(line[3])
-                        wsrt = pmin
-                        wend = pmax
-                    elif len(line) == 3: # just phone
-                        pmin = round(float(line[0]) / samplerate, 5)
-                        pmax = round(float(line[1]) / samplerate, 5)
-                        if line[2] == 'sp' and pmin != pmax:
-                            if wmrk:
-                                word.add(wsrt, wend, wmrk)
-                            wmrk = decode(line[2])
-                            wsrt = pmin
-                            wend = pmax
-                        elif pmin != pmax:
-                            phon.add(pmin, pmax, line[2])
-                        wend = pmax
-                    else: # it's a period
-                        word.add(wsrt, wend, wmrk)
-                        self.grids.append(grid)
-                        break
-                grid.append(phon)
-                grid.append(word)
-            else:
-                source.close()
-                break
+        self._grids = list(iterMLF(f, samplerate))
 
-    def write(self, prefix=''):
+    def write(self, prefix='', format='long', n_jobs=1):
         """ 
-        Write the current state into Praat-formatted TextGrids. The 
+        Write the current state into Praat-formatted TextGrids, in the 
+        given format (see TextGrid.write). The 
         filenames that the output is stored in are taken from the HTK 
         label files. If a string argument is given, then the any prefix in 
         the name of the label file (e.g., "mfc/myLabFile.lab"), it is 
         truncated and files are written to the directory given by the 
         prefix. An IOError will result if the folder does not exist.
     
+        If n_jobs is more than 1 and the TextGrids have not been read 
+        in, the file is split into chunks of whole records (see splitMLF) 
+        which are parsed and written by a pool of n_jobs processes.
+
         The number of TextGrids is returned.
         """
-        for grid in self.grids:
-            (junk, tail) = os.path.split(grid.name)
-            (root, junk) = os.path.splitext(tail)
-            my_path = os.path.join(prefix, root + '.TextGrid')
-            grid.write(codecs.open(my_path, 'w', 'UTF-8'))
-        return len(self.grids)
+        if n_jobs < 2 or self._grids is not None:
+            return writeGrids(self, prefix, format)
+        # a few chunks per process, so none waits long on another
+        chunks = splitMLF(self.f, 4 * n_jobs)
+        pool = Pool(n_jobs)
+        try:
+            return sum(pool.imap_unordered(_writeMLFChunk, 
+                                           [(self.f, chunk, 
+                                             self.samplerate, prefix, 
+                                             format) for chunk in chunks]))
+        finally:
+            pool.terminate()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# viterbi.py: forced alignment in Python, with NumPy, rather than HVite
+#
+# This does what align.py asks of HVite (-a -b sil -m -o SM), with the
+# models read by hmm.py: each utterance is a sequence of words, bounded
+# by "sil", each with one or more pronunciations (which, as in the task
+# dictionary, end in an optional "sp"), and the best path through them is
+# found by Viterbi search, pruned with a beam, as HVite does with -t. The
+# result is a TextGrid, like those textgrid.py reads from HVite's MLF.
+#
+# USAGE: python viterbi.py [-d dictionary.txt] [-m MOD/] in.wav in.lab
+#
+# aligns a single wav/lab pair, and prints the TextGrid.
+
+import os
+
+from sys import argv, stdout, stderr, exit
+from getopt import getopt, GetoptError
+from multiprocessing import Pool
+
+import numpy as np
+
+import mfcc
+
+from hmm import read_models
+from textgrid import gridFromSegments
+
+SIL = 'sil'
+SP = 'sp'
+# frame shift of the features, in seconds
+SHIFT = .01
+# initial beam, its increment when no path survives, and its limit (as in
+# align.py's PRUNING)
+BEAM = (250., 150., 2000.)
+
+
+def _log(p):
+    with np.errstate(divide='ignore'):
+        return np.log(p)
+
+
+class Graph(object):
+    """
+    The states of an utterance, compiled for Viterbi search. Each of the
+    S emitting states of the utterance's phone HMMs has an index into the
+    models' state pool (states), and the index of the phone it is part of
+    (phones, an index into labels, which holds a (phone, word) pair for
+    each, where word is None except for the first phone of each word).
+    Transitions through non-emitting states (the entry and exit states of
+    HMMs, and so the skip over a "sp") are folded into transitions between
+    emitting states: preds holds the predecessors of each state, padded
+    with S, and pred_logp their log probabilities (-inf for padding).
+    init and final are the log probabilities of starting and ending in
+    each state.
+    """
+
+    def __init__(self, models, words):
+        """
+        Builds the graph for words, a list of (word, prons) pairs, where
+        prons is a list of pronunciations, each a list of phones
+        """
+        self.labels = []
+        states = []
+        phones = []
+        edges = []  # (source, destination, log probability)
+        # non-emitting nodes are numbered from -1 down
+        self._n_null = 0
+        start = self._null()
+        exits = [start]
+        for (word, prons) in words:
+            junction = self._null()
+            for source in exits:
+                edges.append((source, junction, 0.))
+            exits = []
+            for pron in prons:
+                entry = junction
+                for (i, phone) in enumerate(pron):
+                    hmm = models[phone]
+                    transp = _log(hmm.transp)
+                    self.labels.append((phone, word if i == 0 else None))
+                    base = len(states)
+                    n = len(hmm.states)
+                    states.extend(hmm.states)
+                    phones.extend([len(self.labels) - 1] * n)
+                    exit = self._null()
+                    # the HMM's states, 0 (entry) to n + 1 (exit)
+                    nodes = [entry] + range(base, base + n) + [exit]
+                    for (j, k) in zip(*np.nonzero(transp > -np.inf)):
+                        edges.append((nodes[j], nodes[k], transp[j, k]))
+                    entry = exit
+                exits.append(entry)
+        end = self._null()
+        for source in exits:
+            edges.append((source, end, 0.))
+        del self._n_null
+        self.states = np.array(states, dtype=int)
+        self.phones = np.array(phones, dtype=int)
+        self._compile(edges, start, end)
+
+    def _null(self):
+        self._n_null += 1
+        return -self._n_null
+
+    def _compile(self, edges, start, end):
+        S = len(self.states)
+        successors = {}
+        for (source, destination, logp) in edges:
+            successors.setdefault(source, []).append((destination, logp))
+        closures = {}
+
+        def closure(node):
+            """
+            Returns the best log probability of reaching each emitting state
+            (or end) from the non-emitting node, via non-emitting nodes
+            """
+            if node not in closures:
+                reached = {}
+                for (destination, logp) in successors.get(node, ()):
+                    if destination >= 0 or destination == end:
+                        paths = [(destination, logp)]
+                    else:
+                        paths = [(state, logp + rest) for (state, rest) in
+                                 closure(destination).iteritems()]
+                    for (state, total) in paths:
+                        if total > reached.get(state, -np.inf):
+                            reached[state] = total
+                closures[node] = reached
+            return closures[node]
+
+        self.init = np.empty(S)
+        self.init.fill(-np.inf)
+        for (state, logp) in closure(start).iteritems():
+            if state >= 0:
+                self.init[state] = logp
+        self.final = np.empty(S)
+        self.final.fill(-np.inf)
+        preds = [{} for _ in xrange(S)]
+        for source in xrange(S):
+            for (destination, logp) in successors.get(source, ()):
+                if destination >= 0:
+                    paths = [(destination, logp)]
+                else:
+                    paths = [(state, logp + rest) for (state, rest) in
+                             closure(destination).iteritems()]
+                for (state, total) in paths:
+                    if state == end:
+                        self.final[source] = max(self.final[source], total)
+                    elif total > preds[state].get(source, -np.inf):
+                        preds[state][source] = total
+        width = max(len(pred) for pred in preds) if preds else 0
+        self.preds = np.empty((S, width), dtype=int)
+        self.preds.fill(S)
+        self.pred_logp = np.empty((S, width))
+        self.pred_logp.fill(-np.inf)
+        for (state, pred) in enumerate(preds):
+            self.preds[state, :len(pred)] = pred.keys()
+            self.pred_logp[state, :len(pred)] = pred.values()
+
+    def __len__(self):
+        return len(self.states)
+
+
+class Decoder(object):
+    """
+    Aligns utterances with models, an HMMSet (see hmm.py), pruning with
+    the beam given by the triple (initial, increment, limit)
+    """
+
+    def __init__(self, models, beam=BEAM):
+        self.models = models
+        self.beam = beam
+        self.gaussians = models.gaussians()
+
+    def search(self, graph, emissions, beam):
+        """
+        Returns the best path through graph for the frames x states matrix
+        of emission log likelihoods (as the state for each frame), and its
+        log probability, or (None, -inf) if no path survives the beam
+        """
+        (T, S) = emissions.shape
+        if T == 0:
+            return (None, -np.inf)
+        rows = np.arange(S)
+        backpointers = np.empty((T, S), dtype=np.int32)
+        scores = np.empty(S + 1)  # with a "state" for padding preds
+        scores[S] = -np.inf
+        scores[:S] = graph.init + emissions[0]
+        for t in xrange(1, T):
+            candidates = scores[graph.preds] + graph.pred_logp
+            best = candidates.argmax(axis=1)
+            backpointers[t] = graph.preds[rows, best]
+            current = candidates[rows, best] + emissions[t]
+            top = current.max()
+            if top == -np.inf:  # every path has been pruned
+                return (None, -np.inf)
+            current[current < top - beam] = -np.inf
+            scores[:S] = current
+        scores = scores[:S] + graph.final
+        state = scores.argmax()
+        if scores[state] == -np.inf:
+            return (None, -np.inf)
+        path = np.empty(T, dtype=int)
+        path[-1] = state
+        for t in xrange(T - 1, 0, -1):
+            path[t - 1] = backpointers[t, path[t]]
+        return (path, scores[path[-1]])
+
+    def align(self, name, features, words):
+        """
+        Aligns features (one row per frame) with words, a list of (word,
+        prons) pairs, between "sil"s. Returns a TextGrid named name, and
+        the average log probability per frame (as HVite reports it), or
+        (None, None) if there is no path. With one-state, one-dimensional
+        models for "sil", "AA1", and "B", and a "sp" with a tee transition:
+
+        >>> from hmm import HMMSet
+        >>> models = HMMSet()
+        >>> one = [[0., 1., 0.], [0., .5, .5], [0., 0., 0.]]
+        >>> for (phone, mean) in (('sil', 0.), ('AA1', 10.), ('B', 20.)):
+        ...     state = models.add_state([mean], [1.])
+        ...     hmm = models.add_hmm(phone, [state], one)
+        >>> tee = [[0., .5, .5], [0., .5, .5], [0., 0., 0.]]
+        >>> hmm = models.add_hmm(SP, [models.add_state([5.], [1.])], tee)
+        >>> words = [('AB', [['AA1', 'B', SP]]), ('BA', [['B', 'AA1', SP]])]
+        >>> def show(frames):
+        ...     features = np.array(frames, dtype=float)[:, np.newaxis]
+        ...     (grid, score) = Decoder(models).align('x', features, words)
+        ...     for tier in grid:
+        ...         print tier.name, ' '.join('{0}-{1:g}'.format(i.mark,
+        ...                                   100 * i.maxTime) for i in tier)
+
+        each frame goes to the phone whose mean it is, and the "sp"s are
+        skipped...
+
+        >>> show([0, 0, 10, 10, 10, 20, 20, 20, 10, 10, 0, 0])
+        phones sil-2 AA1-5 B-7 B-8 AA1-10 sil-12
+        words sil-2 AB-7 BA-10 sil-12
+
+        ...unless there are frames for them (a "sp" is only marked in the
+        words tier, as in the TextGrids made from HVite's alignments):
+
+        >>> show([0, 0, 10, 10, 20, 5, 5, 20, 10, 0])
+        phones sil-2 AA1-4 B-5 B-8 AA1-9 sil-10
+        words sil-2 AB-5 sp-7 BA-9 sil-10
+
+        With fewer frames than phones, there is no path:
+
+        >>> Decoder(models).align('x', np.zeros((3, 1)), words)
+        (None, None)
+        """
+        graph = Graph(self.models, [(SIL, [[SIL]])] + list(words) +
+                                   [(SIL, [[SIL]])])
+        emissions = self.gaussians.log_likelihoods(features)[:,
+                                                       graph.states]
+        (initial, increment, limit) = self.beam
+        beam = initial
+        while True:
+            (path, score) = self.search(graph, emissions, beam)
+            if path is not None or beam >= limit:
+                break
+            beam = min(beam + increment, limit)
+        if path is None:
+            return (None, None)
+        # one segment for each run of frames in the same phone
+        phones = graph.phones[path]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(phones)) + 1))
+        ends = np.concatenate((starts[1:], [len(phones)]))
+        segments = []
+        for (start, end) in zip(starts, ends):
+            (phone, word) = graph.labels[phones[start]]
+            segments.append((round(start * SHIFT, 5), round(end * SHIFT, 5),
+                             phone, word))
+        return (gridFromSegments(name, segments), score / len(path))
+
+
+_decoder = None  # for align_files' worker processes
+
+
+def _align_file(job):
+    (name, wav, mfc, words) = job
+    if wav:
+        features = mfcc.features(wav)
+        if mfc:
+            mfcc.write_htk(mfc, features)
+    else:
+        features = mfcc.read_htk(mfc)[0]
+    return (name, _decoder.align(name, features, words))
+
+
+def align_files(decoder, jobs, n_jobs=1):
+    """
+    Aligns each of jobs, (name, wav, mfc, words) tuples, with decoder,
+    yielding (name, (TextGrid, score)) pairs in the order they finish. The
+    features are computed from wav (and, if mfc is also given, written to
+    it), or, if wav is None, read from mfc. If n_jobs is more than 1, a
+    pool of n_jobs processes is used.
+    """
+    global _decoder
+    _decoder = decoder
+    if n_jobs < 2:
+        for job in jobs:
+            yield _align_file(job)
+        return
+    pool = Pool(n_jobs)  # the workers inherit _decoder
+    try:
+        for result in pool.imap_unordered(_align_file, jobs):
+            yield result
+    finally:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    dictionary = 'dictionary.txt'
+    model_dir = 'MOD'
+    try:
+        (opts, args) = getopt(argv[1:], 'd:m:')
+        for (opt, val) in opts:
+            if opt == '-d':
+                dictionary = val
+            elif opt == '-m':
+                model_dir = val
+        if len(args) != 2:
+            raise GetoptError('Expected a .wav and a .lab file')
+    except GetoptError as err:
+        print >> stderr, 'USAGE: {0} [-d dictionary.txt] [-m MOD/] ' \
+                         'in.wav in.lab'.format(argv[0])
+        exit(str(err))
+    # not imported above, as align.py imports this module
+    from align import PronDict, CMU_PHONES, task_prons
+    the_dict = PronDict(dictionary, CMU_PHONES)
+    words = []
+    with open(args[1], 'r') as source:
+        for word in source.readline().split():
+            if word not in the_dict:
+                exit('Out of dictionary word: {0}'.format(word))
+            words.append((word, task_prons(the_dict, word)))
+    decoder = Decoder(read_models(os.path.join(model_dir, 'macros'),
+                                  os.path.join(model_dir, 'hmmdefs')))
+    (grid, score) = decoder.align(args[1], mfcc.features(args[0]), words)
+    if grid is None:
+        exit('No path found.')
+    print >> stderr, 'Average log probability per frame: {0:.4f}'.format(
+                                                                    score)
+    grid.write(stdout)